@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+
+import photos
+import emotion_backends
+
+STAGES = ["decode", "detect", "emotion", "draw", "resize", "write"]
+PERCENTILES = (50, 90, 99)
+
+class FakeBackend:
+    """
+    Deterministic stand-in for the face detector and emotion model.
+    Returns the same two faces (placed relative to the image size) and fixed emotion scores,
+    so rendering and I/O can be benchmarked without model weights.
+    """
+
+    name = "fake"
+    EMOTIONS = {"angry": 4.0, "disgust": 0.5, "fear": 6.5, "happy": 61.0, "sad": 8.0, "surprise": 5.0, "neutral": 15.0}
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        size = max(1, min(width, height) // 5)
+        boxes = [(width // 4, height // 3), (width // 2, height // 4)]
+        return [{"face": image[y:y + size, x:x + size], "facial_area": {"x": x, "y": y, "w": size, "h": size},
+                 "confidence": 0.99} for x, y in boxes]
+
+    def classify(self, faces):
+        return [dict(self.EMOTIONS) for _ in faces]
+
+class DeepFaceBackend:
+    """The real pipeline: pyramid detection and batched emotion classification from face_pipeline."""
+
+    name = "deepface"
+
+    def __init__(self):
+        import face_pipeline
+        self.pipeline = face_pipeline
+
+    def detect(self, image):
+        return self.pipeline.detect_faces(image)
+
+    def classify(self, faces):
+        scores = self.pipeline.classify_emotions([face["face"] for face in faces])
+        return [{label: float(score) for label, score in zip(self.pipeline.EMOTION_LABELS, row)} for row in scores]
+
+def summarize(samples):
+    """Latency statistics in milliseconds for one stage."""
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    if values.size == 0:
+        return {}
+    summary = {f"p{percentile}_ms": float(np.percentile(values, percentile)) for percentile in PERCENTILES}
+    summary.update({"mean_ms": float(values.mean()), "max_ms": float(values.max()), "count": int(values.size)})
+    return summary
+
+def run(folder_path, backend, repeats=1, warmup=1):
+    """Push every image in a folder through each stage and return the JSON-ready report."""
+    images = photos.list_images(folder_path)
+    if not images:
+        raise ValueError(f"No supported images found in {folder_path}")
+    output_dir = tempfile.mkdtemp(prefix="emotion_benchmark_")
+    timings = {stage: [] for stage in STAGES}
+
+    def process(image_path, record):
+        clock = time.perf_counter
+        start = clock()
+        image = cv2.imread(image_path)
+        decoded = clock()
+        faces = backend.detect(image)
+        detected = clock()
+        emotions = backend.classify(faces)
+        classified = clock()
+        analysis = [{"region": face["facial_area"], "emotion": emotion, "dominant_emotion": max(emotion, key=emotion.get)}
+                    for face, emotion in zip(faces, emotions)]
+        photos.draw_face_box_and_emotions(image, analysis)
+        drawn = clock()
+        photos.resize_image_for_display(image)
+        resized = clock()
+        cv2.imwrite(os.path.join(output_dir, os.path.basename(image_path)), image)
+        written = clock()
+        if record:
+            for stage, elapsed in zip(STAGES, (decoded - start, detected - decoded, classified - detected,
+                                               drawn - classified, resized - drawn, written - resized)):
+                timings[stage].append(elapsed)
+
+    try:
+        for _ in range(warmup):
+            process(images[0], record=False)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for image_path in images:
+                process(image_path, record=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    processed = len(images) * repeats
+    return {
+        "backend": backend.name,
+        "folder": folder_path,
+        "images": processed,
+        "images_per_second": processed / elapsed if elapsed else 0.0,
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+        "environment": environment(),
+    }
+
+def environment():
+    """Describe what the numbers were measured on, so reports from different commits can be compared."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "opencv": cv2.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "emotion_backend": emotion_backends.backend_name()}
+
+STARTUP_MODULES = ["emotion_detector", "photos", "inference_server", "face_pipeline"]
+
+def measure_import(module, repeats=3):
+    """Median wall time of importing a module in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    samples = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return float(np.median(samples))
+
+def run_startup(timeout=120):
+    """Import times of the main modules plus window, first-frame and model-ready times of the live window."""
+    report = {"imports_seconds": {module: measure_import(module) for module in STARTUP_MODULES}}
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, "emotion_detector.py", "--startup-benchmark"],
+                                capture_output=True, text=True, timeout=timeout)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        live = json.loads(lines[-1]) if lines else {"error": result.stderr.strip()[-500:]}
+    except subprocess.TimeoutExpired:
+        live = {"error": f"no first frame within {timeout} seconds"}
+    live["process_seconds"] = time.perf_counter() - start
+    report["live_window"] = live
+    report["environment"] = environment()
+    return report
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process so far (or of its largest finished child), in MB. Unix only."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def make_synthetic_folder(folder_path, count, width, height):
+    """Fill a folder with `count` large JPEGs (copies of one generated photo-like image)."""
+    random = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + random.normal(0, 20, (height, 1, 3)), 0, 255).astype(np.uint8)
+    image = np.ascontiguousarray(np.broadcast_to(image, (height, width, 3)))
+    first = os.path.join(folder_path, "synthetic_00000.jpg")
+    cv2.imwrite(first, image)
+    for index in range(1, count):
+        shutil.copyfile(first, os.path.join(folder_path, f"synthetic_{index:05d}.jpg"))
+
+def memory_child(mode, folder_path, limit_mb):
+    """
+    Walk a folder through the navigator's render path and report the peak RSS.
+    'reduced' is the current path (header-sized, reduced-resolution decode); 'full' decodes every image at full size.
+    """
+    from overlay import synthetic_analysis
+    from prefetch import Prefetcher
+
+    baseline = peak_rss_mb()
+    images = photos.list_images(folder_path)
+
+    def render(position):
+        if mode == "reduced":
+            image, factor = photos.read_for_display(images[position])
+        else:
+            image, factor = cv2.imread(images[position]), 1
+        height, width = image.shape[:2]
+        analysis = synthetic_analysis(width * factor, height * factor, 3)
+        photos.draw_face_box_and_emotions(image, photos.scale_analysis(analysis, factor) if factor != 1 else analysis)
+        return cv2.cvtColor(photos.resize_image_for_display(image), cv2.COLOR_BGR2RGB)
+
+    prefetcher = Prefetcher(render, len(images), max_bytes=limit_mb * 1024 * 1024 // 4)
+    start = time.perf_counter()
+    for position in range(len(images)):
+        prefetcher.request(position).result()
+    elapsed = time.perf_counter() - start
+    prefetcher.close()
+    print(json.dumps({"mode": mode, "images": len(images), "seconds": elapsed,
+                      "baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb()}))
+
+def memory_batch_child(folder_path, limit_mb):
+    """
+    Run a batch analysis over a folder and report the peak RSS of this process, of the largest worker,
+    and the resulting estimate for the whole run (this process plus every worker at its peak).
+    """
+    baseline = peak_rss_mb()
+    workers = photos.batch_workers(None, limit_mb)
+    start = time.perf_counter()
+    photos.run_batch(folder_path, workers=workers, output_path=os.path.join(folder_path, "batch_results.jsonl"),
+                     memory_limit_mb=limit_mb)
+    elapsed = time.perf_counter() - start
+    worker_peak = peak_rss_mb(children=True)
+    parent_peak = peak_rss_mb()
+    print(json.dumps({"mode": "batch", "images": len(photos.list_images(folder_path)), "workers": workers,
+                      "seconds": elapsed, "baseline_rss_mb": baseline, "parent_peak_rss_mb": parent_peak,
+                      "worker_peak_rss_mb": worker_peak, "peak_rss_mb": parent_peak + workers * worker_peak}))
+
+def run_memory(count=100, width=6000, height=4000, limit_mb=photos.MEMORY_LIMIT_MB, batch_images=0):
+    """
+    Peak RSS of the reduced and the full-resolution render paths over a synthetic folder of large photos,
+    and with batch_images > 0 of a batch run over that many of them (needs the DeepFace model weights).
+    """
+    folder_path = tempfile.mkdtemp(prefix="emotion_memory_")
+    try:
+        make_synthetic_folder(folder_path, count, width, height)
+        report = {"images": count, "width": width, "height": height, "limit_mb": limit_mb}
+        for mode in ("reduced", "full"):
+            result = subprocess.run([sys.executable, __file__, "--memory-child", mode, folder_path, "--limit-mb", str(limit_mb)],
+                                    capture_output=True, text=True)
+            lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+            report[mode] = json.loads(lines[-1]) if lines else {"error": result.stderr.strip()[-500:]}
+        report["within_limit"] = report["reduced"].get("peak_rss_mb", float("inf")) <= limit_mb
+        if batch_images:
+            batch_folder = os.path.join(folder_path, "batch")
+            os.makedirs(os.path.join(batch_folder, "images"))
+            for name in photos.list_images(folder_path)[:batch_images]:
+                shutil.copyfile(name, os.path.join(batch_folder, "images", os.path.basename(name)))
+            # Run from the scratch folder so the annotated copies, cache and results store land there
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--memory-child", "batch",
+                                     os.path.join(batch_folder, "images"), "--limit-mb", str(limit_mb)],
+                                    capture_output=True, text=True, cwd=batch_folder)
+            lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+            report["batch"] = json.loads(lines[-1]) if lines else {"error": result.stderr.strip()[-500:]}
+            report["within_limit"] = report["within_limit"] and report["batch"].get("peak_rss_mb", float("inf")) <= limit_mb
+    finally:
+        shutil.rmtree(folder_path, ignore_errors=True)
+    report["environment"] = environment()
+    return report
+
+def run_store(rows=1_000_000, days=7, repeats=3):
+    """
+    Time the results store's filtered query, count and summary (stress grade above 60 within the last `days`)
+    over a synthetic store of `rows` faces, one per capture every 3 seconds, and report each query plan.
+    """
+    import results_store
+
+    folder_path = tempfile.mkdtemp(prefix="emotion_store_")
+    try:
+        store = results_store.ResultStore(os.path.join(folder_path, "results.sqlite"))
+        random = np.random.default_rng(0)
+        now = time.time()
+        created = now - np.arange(rows, 0, -1) * 3.0
+        emotions = random.uniform(0, 30, (rows, len(results_store.EMOTIONS)))
+        stress = random.uniform(0, 100, rows)
+        dominant = np.array(results_store.EMOTIONS)[emotions.argmax(axis=1)]
+        placeholders = ", ".join("?" for _ in range(len(results_store.EMOTIONS) + 9))
+        start = time.perf_counter()
+        with store.lock:
+            store.connection.executemany(
+                "INSERT INTO captures (id, created, kind, source, face_count) VALUES (?, ?, 'live', '0', 1)",
+                zip(range(1, rows + 1), created.tolist()))
+            store.connection.executemany(
+                f"INSERT INTO faces (capture_id, created, x, y, w, h, confidence, {', '.join(results_store.EMOTIONS)}, "
+                f"dominant_emotion, stress_grade) VALUES ({placeholders})",
+                ([index + 1, created[index], 0, 0, 100, 100, 0.9, *emotions[index], dominant[index], stress[index]]
+                 for index in range(rows)))
+            store.connection.commit()
+            store.connection.execute("ANALYZE")
+        report = {"rows": rows, "build_seconds": time.perf_counter() - start}
+        filters = {"min_stress": 60, "since": now - days * 86400}
+        statements = []
+        for name, call in (("query", lambda: store.query(**filters)), ("count", lambda: store.count(**filters)),
+                           ("summary", lambda: store.summary(**filters))):
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                call()
+                samples.append((time.perf_counter() - start) * 1000)
+            # The trace callback sees each statement with its parameters filled in, ready for EXPLAIN QUERY PLAN
+            store.connection.set_trace_callback(statements.append)
+            call()
+            store.connection.set_trace_callback(None)
+            plan = [row[3] for sql in statements if sql.lstrip().upper().startswith("SELECT")
+                    for row in store.connection.execute("EXPLAIN QUERY PLAN " + sql)]
+            statements.clear()
+            report[name] = {"p50_ms": float(np.percentile(samples, 50)), "plan": plan,
+                            "temp_b_tree": any("TEMP B-TREE" in step for step in plan)}
+        report["matching_faces"] = store.count(**filters)
+        store.close()
+    finally:
+        shutil.rmtree(folder_path, ignore_errors=True)
+    report["environment"] = environment()
+    return report
+
+def compare(report, baseline):
+    """Print the change of every stage's p50 and of the throughput against an earlier report."""
+    for stage in STAGES:
+        old = baseline.get("stages", {}).get(stage, {}).get("p50_ms")
+        new = report["stages"].get(stage, {}).get("p50_ms")
+        if old and new:
+            print(f"{stage:>8}: p50 {old:8.2f} ms -> {new:8.2f} ms ({(new - old) / old * 100:+.1f}%)")
+    old, new = baseline.get("images_per_second"), report["images_per_second"]
+    if old:
+        print(f"throughput: {old:.2f} -> {new:.2f} images/s ({(new - old) / old * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage performance benchmark over an image folder.")
+    parser.add_argument("folder", nargs="?", default="dataset")
+    parser.add_argument("--backend", choices=["fake", "deepface"], default="fake",
+                        help="'fake' needs no model weights and only measures decode, drawing, resize and I/O")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--startup", action="store_true",
+                        help="measure module import times and time to first frame / model ready of the live window")
+    parser.add_argument("--display", action="store_true",
+                        help="compare the live window's frame-to-Tk display path with the previous one (needs a display)")
+    parser.add_argument("--memory", action="store_true",
+                        help="check the peak RSS of the navigator render path over a synthetic folder of large photos")
+    parser.add_argument("--memory-images", type=int, default=100, help="number of synthetic photos for --memory")
+    parser.add_argument("--memory-batch", type=int, default=0, metavar="N",
+                        help="with --memory, also check a batch run over N of the photos (needs the DeepFace weights)")
+    parser.add_argument("--limit-mb", type=int, default=photos.MEMORY_LIMIT_MB, help="memory ceiling for --memory")
+    parser.add_argument("--store", action="store_true",
+                        help="time the results store's filtered queries over a synthetic store and print their query plans")
+    parser.add_argument("--store-rows", type=int, default=1_000_000, help="number of synthetic faces for --store")
+    parser.add_argument("--memory-child", nargs=2, metavar=("MODE", "DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", metavar="REPORT", help="print the difference against an earlier JSON report")
+    args = parser.parse_args()
+
+    if args.memory_child:
+        mode, folder_path = args.memory_child
+        if mode == "batch":
+            memory_batch_child(folder_path, args.limit_mb)
+        else:
+            memory_child(mode, folder_path, args.limit_mb)
+        return
+    if args.startup:
+        report = run_startup()
+    elif args.display:
+        import tk_display
+        report = tk_display.benchmark()
+        report["environment"] = environment()
+    elif args.memory:
+        if sys.platform == "win32":
+            sys.exit("--memory reads the peak RSS through the resource module, which is not available on Windows")
+        report = run_memory(count=args.memory_images, limit_mb=args.limit_mb, batch_images=args.memory_batch)
+    elif args.store:
+        report = run_store(rows=args.store_rows)
+    else:
+        backend = FakeBackend() if args.backend == "fake" else DeepFaceBackend()
+        report = run(args.folder, backend, repeats=args.repeats)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.memory and not report["within_limit"]:
+        sys.exit(f"Peak RSS above the {args.limit_mb} MB limit")
+    if args.compare and not (args.startup or args.memory or args.display or args.store):
+        with open(args.compare, encoding="utf-8") as file:
+            compare(report, json.load(file))
+
+if __name__ == "__main__":
+    main()
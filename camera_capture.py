@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import cv2
+import metrics
+from live_analysis import RateMeter
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+POLICIES = (DROP_OLDEST, DROP_NEWEST)
+RING_SLOTS = 4
+
+class Frame:
+    """One slot of the ring: a reusable image buffer plus the capture time and sequence number of its contents."""
+
+    __slots__ = ("image", "timestamp", "sequence")
+
+    def __init__(self):
+        self.image = None
+        self.timestamp = 0.0
+        self.sequence = 0
+
+class FrameRing:
+    """
+    Fixed set of frame buffers shared by one capture thread and its consumers.
+    The capture thread decodes straight into a free slot; consumers borrow a filled slot, use its
+    image in place and release it. When every slot is full, DROP_OLDEST overwrites the oldest unread
+    frame and DROP_NEWEST discards the frame that just arrived; either way the drop is counted.
+    """
+
+    def __init__(self, slots=RING_SLOTS, policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.policy = policy
+        self.condition = threading.Condition()
+        self.free = deque(Frame() for _ in range(slots))
+        self.ready = deque()  # Oldest first
+        self.sequence = 0
+        self.captured = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.age = metrics.Histogram("frame_age")
+
+    def writable(self):
+        """Slot for the next capture, or None when the new frame has to be dropped."""
+        with self.condition:
+            if self.free:
+                return self.free.popleft()
+            if self.policy == DROP_OLDEST and self.ready:
+                self.dropped += 1
+                return self.ready.popleft()
+            return None
+
+    def publish(self, frame, timestamp):
+        with self.condition:
+            self.sequence += 1
+            frame.sequence = self.sequence
+            frame.timestamp = timestamp
+            self.ready.append(frame)
+            self.captured += 1
+            self.condition.notify_all()
+
+    def discard(self):
+        """Count a frame that was captured without a slot to keep it in."""
+        with self.condition:
+            self.captured += 1
+            self.dropped += 1
+
+    def unused(self, frame):
+        """Give back a slot from writable() that was not filled."""
+        with self.condition:
+            self.free.appendleft(frame)
+
+    def borrow(self, latest=False, timeout=None):
+        """
+        Take a filled slot, the oldest one by default. With latest=True the newest frame is returned and
+        the older unread ones are dropped. Returns None when nothing arrives within the timeout.
+        The caller must release() the frame when it no longer needs the image.
+        """
+        with self.condition:
+            if not self.ready and timeout:
+                self.condition.wait(timeout)
+            if not self.ready:
+                return None
+            if latest:
+                while len(self.ready) > 1:
+                    self.free.append(self.ready.popleft())
+                    self.dropped += 1
+            frame = self.ready.popleft()
+            self.delivered += 1
+        age = time.perf_counter() - frame.timestamp
+        self.age.observe(age)
+        metrics.observe("frame_age", age)
+        return frame
+
+    def release(self, frame):
+        with self.condition:
+            self.free.append(frame)
+
+    def stats(self):
+        with self.condition:
+            captured, delivered, dropped = self.captured, self.delivered, self.dropped
+        return {"captured": captured, "delivered": delivered, "dropped": dropped,
+                "drop_rate": round(dropped / captured, 3) if captured else 0.0,
+                "frame_age_mean_ms": round(self.age.snapshot()["mean_seconds"] * 1000, 1),
+                "frame_age_p90_ms": round(self.age.quantile(0.9) * 1000, 1)}
+
+class CameraCapture(threading.Thread):
+    """
+    Reads a cv2.VideoCapture on its own thread into a FrameRing, so the driver buffer is drained
+    however slow the consumer is and consumers always see fresh frames.
+    Args:
+        cap: An opened cv2.VideoCapture.
+        slots: Number of preallocated frame buffers.
+        policy: DROP_OLDEST or DROP_NEWEST, applied when every buffer is full.
+        fps: Pace reads to this rate (for video files standing in for a camera); None reads as fast as frames come.
+    """
+
+    def __init__(self, cap, slots=RING_SLOTS, policy=DROP_OLDEST, fps=None):
+        super().__init__(name="camera-capture", daemon=True)
+        self.cap = cap
+        self.ring = FrameRing(slots, policy)
+        self.fps = fps
+        self.meter = RateMeter()
+        self.scratch = None  # Decode target for frames that are dropped on arrival
+        self.running = True
+        self.failed = False
+        self.finished = threading.Event()
+
+    def run(self):
+        interval = 1 / self.fps if self.fps else 0
+        next_frame = time.perf_counter()
+        try:
+            while self.running:
+                frame = self.ring.writable()
+                target = frame.image if frame is not None else self.scratch
+                with metrics.span("camera_read"):
+                    ret, image = self.cap.read(target) if target is not None else self.cap.read()
+                timestamp = time.perf_counter()
+                if not ret:
+                    if frame is not None:
+                        self.ring.unused(frame)
+                    self.failed = True
+                    break
+                self.meter.tick()
+                if frame is None:
+                    self.scratch = image
+                    self.ring.discard()
+                else:
+                    frame.image = image  # Same buffer unless the frame size changed
+                    self.ring.publish(frame, timestamp)
+                if interval:
+                    next_frame += interval
+                    delay = next_frame - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            self.finished.set()
+            with self.ring.condition:
+                self.ring.condition.notify_all()
+
+    def stop(self):
+        self.running = False
+        self.finished.wait(2)
+        self.cap.release()
+
+    def stats(self):
+        stats = self.ring.stats()
+        stats["capture_fps"] = round(self.meter.rate(), 1)
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure frame age and drop rate of the threaded capture ring.")
+    parser.add_argument("source", nargs="?", default="0", help="camera index or video file")
+    parser.add_argument("--slots", type=int, default=RING_SLOTS)
+    parser.add_argument("--policy", choices=POLICIES, default=DROP_OLDEST)
+    parser.add_argument("--consumer-ms", type=float, default=15.0, help="simulated work per consumed frame")
+    parser.add_argument("--latest", action="store_true", help="consume the newest frame instead of the oldest, like the live window")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {args.source}")
+    # Video files are read at their own frame rate, like a camera would deliver them
+    fps = (cap.get(cv2.CAP_PROP_FPS) or 30.0) if isinstance(source, str) and os.path.isfile(source) else None
+    camera = CameraCapture(cap, slots=args.slots, policy=args.policy, fps=fps)
+    camera.start()
+
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end and not camera.finished.is_set():
+        frame = camera.ring.borrow(latest=args.latest, timeout=0.5)
+        if frame is None:
+            continue
+        time.sleep(args.consumer_ms / 1000)
+        camera.ring.release(frame)
+    camera.stop()
+    print(json.dumps(camera.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
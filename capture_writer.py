@@ -0,0 +1,111 @@
+import os
+import json
+import queue
+import threading
+import cv2
+import metrics
+
+MAX_QUEUED = 16
+FORMATS = {"jpg": ".jpg", "jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+def encode_params(extension, quality, png_compression):
+    """cv2.imencode parameters for a file extension."""
+    if extension in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if extension == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    if extension == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return []
+
+class CaptureWriter:
+    """
+    Encodes and writes captures on a background thread, so the UI never waits for the disk.
+    Args:
+        image_format: 'jpg', 'png' or 'webp'; None keeps the extension of the path passed to submit().
+        quality: JPEG/WebP quality (0-100).
+        png_compression: PNG compression level (0-9).
+        sidecar: Also write the capture's metadata next to it as <capture>.json.
+        max_queued: Captures waiting to be written; submit() blocks (or gives up when block=False) beyond that.
+    """
+
+    def __init__(self, image_format=None, quality=95, png_compression=3, sidecar=False, max_queued=MAX_QUEUED):
+        if image_format is not None and image_format.lower() not in FORMATS:
+            raise ValueError(f"Unsupported capture format: {image_format}")
+        self.extension = FORMATS[image_format.lower()] if image_format else None
+        self.quality = quality
+        self.png_compression = png_compression
+        self.sidecar = sidecar
+        self.queue = queue.Queue(max_queued)
+        self.written = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.run, name="capture-writer", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_environment(cls, **defaults):
+        """
+        Build a writer from EMOTION_CAPTURE_FORMAT, EMOTION_CAPTURE_QUALITY, EMOTION_CAPTURE_PNG_COMPRESSION
+        and EMOTION_CAPTURE_SIDECAR=1, falling back to the given keyword defaults.
+        """
+        settings = dict(defaults)
+        if os.environ.get("EMOTION_CAPTURE_FORMAT"):
+            settings["image_format"] = os.environ["EMOTION_CAPTURE_FORMAT"]
+        if os.environ.get("EMOTION_CAPTURE_QUALITY"):
+            settings["quality"] = int(os.environ["EMOTION_CAPTURE_QUALITY"])
+        if os.environ.get("EMOTION_CAPTURE_PNG_COMPRESSION"):
+            settings["png_compression"] = int(os.environ["EMOTION_CAPTURE_PNG_COMPRESSION"])
+        if os.environ.get("EMOTION_CAPTURE_SIDECAR"):
+            settings["sidecar"] = os.environ["EMOTION_CAPTURE_SIDECAR"] == "1"
+        return cls(**settings)
+
+    def output_path(self, path):
+        """The path a capture submitted as `path` ends up at, with the configured format's extension."""
+        if self.extension is None:
+            return path
+        return os.path.splitext(path)[0] + self.extension
+
+    def submit(self, image, path, metadata=None, block=True):
+        """
+        Queue an image to be written. The array is queued as is, without a copy, so the caller must not
+        modify it after submitting; pass a copy of a buffer that is reused.
+        Returns the final path, or None when the queue is full and block is False.
+        """
+        path = self.output_path(path)
+        try:
+            self.queue.put((image, path, metadata), block=block)
+        except queue.Full:
+            print(f"Capture queue is full, skipped {path}")
+            return None
+        return path
+
+    def run(self):
+        while True:
+            image, path, metadata = self.queue.get()
+            try:
+                with metrics.span("capture_write"):
+                    self.write(image, path, metadata)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to write capture {path}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def write(self, image, path, metadata):
+        extension = os.path.splitext(path)[1].lower()
+        ok, encoded = cv2.imencode(extension, image, encode_params(extension, self.quality, self.png_compression))
+        if not ok:
+            raise ValueError(f"Could not encode {extension} image")
+        # Write under a temporary name so a partially written capture is never left behind
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(encoded.tobytes())
+        os.replace(temporary_path, path)
+        if self.sidecar and metadata is not None:
+            with open(f"{path}.json", "w", encoding="utf-8") as file:
+                json.dump(metadata, file, indent=2)
+
+    def flush(self):
+        """Wait until every queued capture has been written, e.g. before the application exits."""
+        self.queue.join()
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import argparse
+import threading
+import cv2
+import numpy as np
+
+import face_pipeline
+
+LIVE = "live"
+BATCH = "batch"
+# DeepFace detector backends, most accurate first; the first one that runs here is the reference for hit rates
+DETECTORS = ("retinaface", "mtcnn", "yunet", "ssd", "mediapipe", "opencv")
+# Auto mode never picks a detector that finds less than this share of the reference detector's faces
+MIN_HIT_RATE = float(os.environ.get("EMOTION_DETECTOR_MIN_HIT_RATE", "0.8"))
+CANDIDATES = tuple(name.strip() for name in
+                   os.environ.get("EMOTION_DETECTOR_CANDIDATES", ",".join(DETECTORS)).split(",") if name.strip())
+# Per profile: detector name or "auto", and the per-frame budget auto mode has to meet
+PROFILES = {
+    LIVE: (os.environ.get("EMOTION_LIVE_DETECTOR", face_pipeline.DETECTOR_BACKEND),
+           float(os.environ.get("EMOTION_LIVE_BUDGET_MS", "40"))),
+    BATCH: (os.environ.get("EMOTION_BATCH_DETECTOR", face_pipeline.DETECTOR_BACKEND),
+            float(os.environ.get("EMOTION_BATCH_BUDGET_MS", "500"))),
+}
+CALIBRATION_PATH = os.path.join("cache", "detector_calibration.json")
+CALIBRATION_FOLDER = "dataset"
+# Calibration images are scaled like the first detection pyramid level
+CALIBRATION_SIZE = 640
+CALIBRATION_VERSION = 2
+
+_chosen = {}
+_chosen_lock = threading.Lock()
+
+def calibration_images(folder_path=CALIBRATION_FOLDER, size=CALIBRATION_SIZE, limit=10):
+    images = []
+    for name in sorted(os.listdir(folder_path))[:limit]:
+        image = cv2.imread(os.path.join(folder_path, name))
+        if image is None:
+            continue
+        scale = min(1.0, size / max(image.shape[:2]))
+        images.append(cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image)
+    return images
+
+def calibrate(candidates=CANDIDATES, folder_path=CALIBRATION_FOLDER):
+    """
+    Time every candidate detector on the calibration images.
+    Returns {detector: {"median_ms", "p90_ms", "faces", "faces_per_image"}} or {detector: {"error"}} for
+    detectors that cannot run here.
+    """
+    images = calibration_images(folder_path)
+    if not images:
+        raise ValueError(f"No calibration images found in {folder_path}")
+    results = {}
+    for detector in candidates:
+        try:
+            face_pipeline.extract_faces(images[0], detector)  # Loads the weights; not timed
+            timings, faces = [], []
+            for image in images:
+                start = time.perf_counter()
+                detected = face_pipeline.extract_faces(image, detector)
+                timings.append(1000 * (time.perf_counter() - start))
+                faces.append(sum(1 for item in detected if item.get("confidence", 0) > 0))
+            results[detector] = {"median_ms": float(np.median(timings)), "p90_ms": float(np.percentile(timings, 90)),
+                                 "faces": sum(faces), "faces_per_image": faces}
+        except Exception as e:
+            results[detector] = {"error": str(e)[:200]}
+        print(f"Calibrated detector {detector}: {json.dumps(results[detector])}")
+    return results
+
+def calibration_key(candidates, folder_path):
+    return "|".join([str(CALIBRATION_VERSION), face_pipeline.deepface_version(), str(os.cpu_count()),
+                     os.path.abspath(folder_path), str(CALIBRATION_SIZE), ",".join(candidates)])
+
+def load_calibration(candidates=CANDIDATES, folder_path=CALIBRATION_FOLDER, path=CALIBRATION_PATH, recalibrate=False):
+    """Calibration results for this machine, measured once and then read back from the cache directory."""
+    key = calibration_key(candidates, folder_path)
+    if not recalibrate and os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as file:
+                cached = json.load(file)
+            if cached.get("key") == key:
+                return cached["results"]
+        except (OSError, ValueError):
+            pass
+    results = calibrate(candidates, folder_path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Several processes may calibrate at once; each writes its own file and the last complete one wins
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump({"key": key, "results": results}, file, indent=2)
+    os.replace(temporary_path, path)
+    return results
+
+def hit_rates(results, candidates=CANDIDATES):
+    """
+    Share of the reference detector's faces each detector finds, image by image: the reference is the
+    most accurate detector in DETECTORS that ran. Returns {} when the reference found no faces.
+    """
+    available = [name for name in DETECTORS if name in candidates and "faces_per_image" in results.get(name, {})]
+    if not available:
+        return {}
+    reference = np.asarray(results[available[0]]["faces_per_image"])
+    if not reference.sum():
+        return {}
+    return {name: float(np.minimum(results[name]["faces_per_image"], reference).sum() / reference.sum())
+            for name in available}
+
+def choose(results, budget_ms, candidates=CANDIDATES, min_hit_rate=MIN_HIT_RATE):
+    """
+    The detector with the best measured hit rate among those whose median latency fits the budget,
+    or the fastest one if none fits. Detectors under min_hit_rate are never chosen; without any usable
+    detector the configured default is kept.
+    """
+    rates = hit_rates(results, candidates)
+    usable = [name for name, rate in rates.items() if rate >= min_hit_rate]
+    if not usable:
+        return face_pipeline.DETECTOR_BACKEND
+    within_budget = [name for name in usable if results[name]["median_ms"] <= budget_ms]
+    if within_budget:
+        return max(within_budget, key=lambda name: (rates[name], -results[name]["median_ms"]))
+    return min(usable, key=lambda name: results[name]["median_ms"])
+
+def detector_for(profile=BATCH):
+    """The detector the live or the batch path should use, resolving auto mode once per process."""
+    with _chosen_lock:
+        if profile not in _chosen:
+            detector, budget_ms = PROFILES[profile]
+            if detector == "auto":
+                detector = choose(load_calibration(), budget_ms)
+                print(f"Auto-selected the {detector} face detector for {profile} analysis (budget {budget_ms:g} ms)")
+            _chosen[profile] = detector
+        return _chosen[profile]
+
+def resolved(profile=BATCH):
+    """The detector for a profile when it is known without calibrating (configured by name or already chosen), else None."""
+    detector, _ = PROFILES[profile]
+    if detector != "auto":
+        return detector
+    with _chosen_lock:
+        return _chosen.get(profile)
+
+def pin(profile, detector):
+    """Use `detector` for a profile in this process, e.g. the choice a parent process already made."""
+    with _chosen_lock:
+        _chosen[profile] = detector
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the face detectors and show which one each profile uses.")
+    parser.add_argument("folder", nargs="?", default=CALIBRATION_FOLDER, help="calibration images")
+    parser.add_argument("--recalibrate", action="store_true", help="measure again instead of using the cached results")
+    args = parser.parse_args()
+
+    results = load_calibration(folder_path=args.folder, recalibrate=args.recalibrate)
+    report = {"calibration": results, "hit_rates": hit_rates(results), "min_hit_rate": MIN_HIT_RATE,
+              "budgets_ms": {profile: budget for profile, (_, budget) in PROFILES.items()},
+              "auto_choice": {profile: choose(results, budget) for profile, (_, budget) in PROFILES.items()},
+              "configured": {profile: detector for profile, (detector, _) in PROFILES.items()}}
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+
+from results_store import EMOTIONS, NEGATIVE_EMOTIONS, KINDS, STORE_PATH
+
+ANALYTICS_PATH = os.path.join("cache", "analytics")
+# Rows per chunk file; the export and every query hold about one chunk of arrays (~50 MB) at a time
+CHUNK_ROWS = 1 << 20
+# Rows taken from SQLite per fetchmany() call during export
+FETCH_ROWS = 8192
+# Faces of one source further apart than this many seconds start a new session
+SESSION_GAP = float(os.environ.get("EMOTION_SESSION_GAP", "300"))
+# Percentiles come from fixed 0.1-point histograms, which add up across chunks without keeping every value
+HISTOGRAM_BINS = 1001
+NEGATIVE_COLUMNS = [EMOTIONS.index(emotion) for emotion in NEGATIVE_EMOTIONS]
+COLUMNS = {"emotions": np.float32, "created": np.float64, "source": np.int32, "session": np.int32, "kind": np.uint8}
+GROUPINGS = ("source", "session", "kind")
+FORMAT_VERSION = 1
+
+class Columns:
+    """
+    Face records as parallel arrays: an (N, 7) float32 emotion matrix in EMOTIONS order, capture
+    timestamps, and source, session and kind ids. Chunks read from a ColumnStore are memory-mapped.
+    """
+
+    def __init__(self, emotions, created, source, session, kind):
+        self.emotions = emotions
+        self.created = created
+        self.source = source
+        self.session = session
+        self.kind = kind
+
+    def __len__(self):
+        return len(self.created)
+
+    def stress(self):
+        """Stress grade of every face, computed like results_store.stress_grade."""
+        return np.clip(self.emotions[:, NEGATIVE_COLUMNS].sum(axis=1), 0, 100)
+
+    def dominant(self):
+        """Index into EMOTIONS of every face's dominant emotion."""
+        return self.emotions.argmax(axis=1)
+
+    def select(self, mask):
+        return Columns(*(getattr(self, name)[mask] for name in COLUMNS))
+
+    @staticmethod
+    def concatenate(parts):
+        parts = list(parts)
+        if not parts:
+            return Columns(*(np.empty((0, len(EMOTIONS)) if name == "emotions" else 0, dtype=dtype)
+                             for name, dtype in COLUMNS.items()))
+        return Columns(*(np.concatenate([getattr(part, name) for part in parts]) for name in COLUMNS))
+
+def source_label(kind, source):
+    """Live captures are grouped by camera; photos and batch results by the folder they came from."""
+    if kind == "live" or not source:
+        return f"{kind}:{source or ''}"
+    return f"{kind}:{os.path.dirname(os.path.abspath(source))}"
+
+class ColumnStore:
+    """
+    Append-only column files exported from the results store: one .npy file per column and chunk,
+    plus meta.json with the chunk list, the source labels and the session state carried between exports.
+    Queries memory-map one chunk at a time, so datasets larger than RAM are streamed.
+    """
+
+    def __init__(self, path=ANALYTICS_PATH):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = self.read_meta()
+        self.source_ids = {label: index for index, label in enumerate(self.meta["sources"])}
+
+    def read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as file:
+                meta = json.load(file)
+            if meta.get("version") == FORMAT_VERSION:
+                return meta
+        except (OSError, ValueError):
+            pass
+        return {"version": FORMAT_VERSION, "last_face_id": 0, "next_session": 0, "sources": [],
+                "last_time": [], "last_session": [], "chunks": []}
+
+    def write_meta(self):
+        path = os.path.join(self.path, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.meta, file)
+        os.replace(path + ".tmp", path)
+
+    @property
+    def sources(self):
+        return self.meta["sources"]
+
+    @property
+    def sessions(self):
+        return self.meta["next_session"]
+
+    def source_id(self, label, create=False):
+        if label not in self.source_ids and create:
+            self.source_ids[label] = len(self.sources)
+            self.sources.append(label)
+            self.meta["last_time"].append(-np.inf)
+            self.meta["last_session"].append(-1)
+        return self.source_ids.get(label)
+
+    def time_range(self):
+        chunks = self.meta["chunks"]
+        if not chunks:
+            return None, None
+        return min(chunk["start"] for chunk in chunks), max(chunk["end"] for chunk in chunks)
+
+    def assign_sessions(self, created, source):
+        """
+        Session id of every new face: a session is a run of faces from one source with no gap over
+        SESSION_GAP seconds. Sessions continue across exports through the per-source state in meta.json.
+        """
+        order = np.lexsort((created, source))
+        sources, times = source[order], created[order]
+        first = np.r_[True, sources[1:] != sources[:-1]]
+        boundaries = first | np.r_[True, np.diff(times) > SESSION_GAP]
+        starts = np.flatnonzero(boundaries)
+
+        last_time = np.asarray(self.meta["last_time"], dtype=np.float64)
+        last_session = np.asarray(self.meta["last_session"], dtype=np.int64)
+        start_sources = sources[starts]
+        continues = (first[starts] & (last_session[start_sources] >= 0)
+                     & (np.abs(times[starts] - last_time[start_sources]) <= SESSION_GAP))
+        segment_sessions = np.empty(len(starts), dtype=np.int64)
+        segment_sessions[continues] = last_session[start_sources[continues]]
+        fresh = int((~continues).sum())
+        segment_sessions[~continues] = self.meta["next_session"] + np.arange(fresh)
+        self.meta["next_session"] += fresh
+
+        sessions = np.empty(len(created), dtype=np.int32)
+        sorted_sessions = segment_sessions[np.cumsum(boundaries) - 1]
+        sessions[order] = sorted_sessions
+
+        ends = np.r_[first[1:], True]
+        last_time[sources[ends]] = times[ends]
+        last_session[sources[ends]] = sorted_sessions[ends]
+        self.meta["last_time"] = last_time.tolist()
+        self.meta["last_session"] = last_session.tolist()
+        return sessions
+
+    def chunk_path(self, name, column):
+        return os.path.join(self.path, f"{name}.{column}.npy")
+
+    def append(self, emotions, created, source, kind, last_face_id=None):
+        """Write one chunk of new faces; the metadata is replaced last, so an interrupted append leaves no partial chunk."""
+        session = self.assign_sessions(created, source)
+        name = f"chunk_{len(self.meta['chunks']):06d}"
+        values = {"emotions": emotions, "created": created, "source": source, "session": session, "kind": kind}
+        for column, dtype in COLUMNS.items():
+            np.save(self.chunk_path(name, column), np.ascontiguousarray(values[column], dtype=dtype))
+        self.meta["chunks"].append({"name": name, "rows": int(len(created)),
+                                    "start": float(created.min()), "end": float(created.max())})
+        if last_face_id is not None:
+            self.meta["last_face_id"] = last_face_id
+        self.write_meta()
+
+    def load_chunk(self, chunk):
+        return Columns(*(np.load(self.chunk_path(chunk["name"], column), mmap_mode="r") for column in COLUMNS))
+
+    def chunks(self, since=None, until=None, kind=None, source=None):
+        """Yield the stored faces chunk by chunk, restricted to a time range, capture kind and source label."""
+        source_id = None
+        if source is not None:
+            source_id = self.source_id(source)
+            if source_id is None:
+                return
+        for chunk in self.meta["chunks"]:
+            if (since is not None and chunk["end"] < since) or (until is not None and chunk["start"] >= until):
+                continue
+            columns = self.load_chunk(chunk)
+            mask = None
+            for condition in ((columns.created >= since) if since is not None and chunk["start"] < since else None,
+                              (columns.created < until) if until is not None and chunk["end"] >= until else None,
+                              (columns.kind == KINDS.index(kind)) if kind is not None else None,
+                              (columns.source == source_id) if source_id is not None else None):
+                if condition is not None:
+                    mask = condition if mask is None else mask & condition
+            if mask is not None:
+                columns = columns.select(mask)
+            if len(columns):
+                yield columns
+
+    def load(self, **filters):
+        """All matching faces in memory as one Columns; use chunks() for datasets that do not fit."""
+        return Columns.concatenate(self.chunks(**filters))
+
+def capture_columns(connection, store, first_id, last_id):
+    """Kind and source id of every capture id in [first_id, last_id], as arrays indexed by id - first_id."""
+    kinds = np.zeros(last_id - first_id + 1, dtype=np.uint8)
+    sources = np.zeros(last_id - first_id + 1, dtype=np.int32)
+    cursor = connection.execute("SELECT id, kind, source FROM captures WHERE id >= ? AND id <= ?", (first_id, last_id))
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            return kinds, sources
+        for capture_id, kind, source in rows:
+            kinds[capture_id - first_id] = KINDS.index(kind)
+            sources[capture_id - first_id] = store.source_id(source_label(kind, source), create=True)
+
+def export(store_path=STORE_PATH, path=ANALYTICS_PATH, rebuild=False, chunk_rows=CHUNK_ROWS):
+    """
+    Append the faces recorded since the last export to the column store; returns the number of new faces.
+    Rows are fetched a few thousand at a time straight into preallocated chunk arrays, so the export holds
+    about one chunk in memory however many faces are stored.
+    """
+    if rebuild and os.path.isdir(path):
+        shutil.rmtree(path)
+    store = ColumnStore(path)
+    connection = sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+    ids = np.empty(chunk_rows, dtype=np.int64)
+    captures = np.empty(chunk_rows, dtype=np.int64)
+    created = np.empty(chunk_rows, dtype=np.float64)
+    emotions = np.empty((chunk_rows, len(EMOTIONS)), dtype=np.float32)
+    exported = 0
+
+    def flush(rows):
+        kinds, sources = capture_columns(connection, store, int(captures[:rows].min()), int(captures[:rows].max()))
+        offsets = captures[:rows] - captures[:rows].min()
+        store.append(emotions[:rows], created[:rows], sources[offsets], kinds[offsets], last_face_id=int(ids[rows - 1]))
+
+    try:
+        cursor = connection.execute(
+            f"SELECT id, capture_id, created, {', '.join(EMOTIONS)} FROM faces WHERE id > ? ORDER BY id",
+            (store.meta["last_face_id"],))
+        filled = 0
+        while True:
+            rows = cursor.fetchmany(min(FETCH_ROWS, chunk_rows - filled))
+            if rows:
+                # Face and capture ids stay far below 2**53, so one float64 block holds every column exactly
+                block = np.array(rows, dtype=np.float64)
+                end = filled + len(rows)
+                ids[filled:end] = block[:, 0]
+                captures[filled:end] = block[:, 1]
+                created[filled:end] = block[:, 2]
+                emotions[filled:end] = block[:, 3:]
+                filled = end
+            if filled and (filled == chunk_rows or not rows):
+                flush(filled)
+                exported += filled
+                filled = 0
+            if not rows:
+                break
+    finally:
+        connection.close()
+    return exported
+
+# --- Analytics: each one streams the chunks once and merges per-chunk partial results ---
+
+def group_size(store, by):
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping {by!r}; choose one of {', '.join(GROUPINGS)}")
+    return {"source": len(store.sources), "session": store.sessions, "kind": len(KINDS)}[by]
+
+def summary(store, by="source", limit=None, **filters):
+    """
+    Per source, session or capture kind: face count, mean and max stress grade, mean emotion scores,
+    dominant emotion counts and the first and last capture time. Largest groups first.
+    """
+    size = group_size(store, by)
+    emotion_count = len(EMOTIONS)
+    faces = np.zeros(size, dtype=np.int64)
+    stress_sum = np.zeros(size)
+    stress_max = np.zeros(size)
+    emotion_sum = np.zeros((size, emotion_count))
+    dominant = np.zeros(size * emotion_count, dtype=np.int64)
+    first = np.full(size, np.inf)
+    last = np.full(size, -np.inf)
+    session_source = np.zeros(store.sessions, dtype=np.int32)
+    for chunk in store.chunks(**filters):
+        group = np.asarray(getattr(chunk, by), dtype=np.int64)
+        stress = chunk.stress()
+        faces += np.bincount(group, minlength=size)
+        stress_sum += np.bincount(group, weights=stress, minlength=size)
+        for column in range(emotion_count):
+            emotion_sum[:, column] += np.bincount(group, weights=chunk.emotions[:, column], minlength=size)
+        dominant += np.bincount(group * emotion_count + chunk.dominant(), minlength=size * emotion_count)
+        # Sorting by group turns the per-group extremes into contiguous reductions
+        order = np.argsort(group, kind="stable")
+        sorted_group = group[order]
+        starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+        present = sorted_group[starts]
+        stress_max[present] = np.maximum(stress_max[present], np.maximum.reduceat(stress[order], starts))
+        created = chunk.created[order]
+        first[present] = np.minimum(first[present], np.minimum.reduceat(created, starts))
+        last[present] = np.maximum(last[present], np.maximum.reduceat(created, starts))
+        session_source[chunk.session] = chunk.source
+
+    dominant = dominant.reshape(size, emotion_count)
+    groups = np.flatnonzero(faces)
+    groups = groups[np.argsort(-faces[groups], kind="stable")][:limit]
+    rows = []
+    for group in groups.tolist():
+        count = int(faces[group])
+        if by == "source":
+            name = store.sources[group]
+        elif by == "kind":
+            name = KINDS[group]
+        else:
+            name = group
+        row = {by: name, "faces": count,
+               "average_stress_grade": round(float(stress_sum[group] / count), 2),
+               "max_stress_grade": round(float(stress_max[group]), 2),
+               "average_emotions": {emotion: round(float(emotion_sum[group, column] / count), 2)
+                                    for column, emotion in enumerate(EMOTIONS)},
+               "dominant_emotions": {emotion: int(dominant[group, column])
+                                     for column, emotion in enumerate(EMOTIONS) if dominant[group, column]},
+               "first": float(first[group]), "last": float(last[group])}
+        if by == "session":
+            row["source"] = store.sources[session_source[group]]
+            row["duration_seconds"] = round(float(last[group] - first[group]), 1)
+        rows.append(row)
+    return rows
+
+def percentiles(store, quantiles=(50, 90, 95, 99), **filters):
+    """Percentiles of the stress grade and of every emotion score, to 0.1 points."""
+    emotion_count = len(EMOTIONS)
+    histogram = np.zeros((emotion_count + 1, HISTOGRAM_BINS), dtype=np.int64)
+    offsets = np.arange(emotion_count, dtype=np.int32) * HISTOGRAM_BINS
+    total = 0
+    for chunk in store.chunks(**filters):
+        bins = np.clip(np.rint(chunk.emotions * 10), 0, HISTOGRAM_BINS - 1).astype(np.int32) + offsets
+        histogram[:emotion_count] += np.bincount(bins.ravel(), minlength=emotion_count * HISTOGRAM_BINS).reshape(
+            emotion_count, HISTOGRAM_BINS)
+        stress_bins = np.clip(np.rint(chunk.stress() * 10), 0, HISTOGRAM_BINS - 1).astype(np.int32)
+        histogram[emotion_count] += np.bincount(stress_bins, minlength=HISTOGRAM_BINS)
+        total += len(chunk)
+    if not total:
+        return {"faces": 0}
+    cumulative = np.cumsum(histogram, axis=1)
+    # Nearest-rank percentiles: the first bin whose cumulative count reaches the rank
+    ranks = np.maximum(1, np.ceil(np.asarray(quantiles, dtype=np.float64) / 100 * total))
+    report = {"faces": total}
+    for row, name in enumerate(EMOTIONS + ["stress_grade"]):
+        values = np.searchsorted(cumulative[row], ranks) / 10
+        report[name] = {f"p{quantile:g}": float(value) for quantile, value in zip(quantiles, values)}
+    return report
+
+def rolling_stress(store, window=300.0, step=60.0, since=None, until=None, **filters):
+    """
+    Mean stress grade over a trailing window, evaluated every `step` seconds from `since` to `until`
+    (the stored time range by default). Returns the window end times, the mean stress and the face count per window.
+    """
+    start, end = store.time_range()
+    start = start if since is None else since
+    end = end if until is None else until
+    if start is None or end is None or end < start:
+        return {"time": np.empty(0), "mean_stress": np.empty(0), "faces": np.empty(0, dtype=np.int64)}
+    buckets = int((end - start) // step) + 1
+    sums = np.zeros(buckets)
+    counts = np.zeros(buckets, dtype=np.int64)
+    for chunk in store.chunks(since=since, until=until, **filters):
+        bucket = ((chunk.created - start) // step).astype(np.int64)
+        valid = (bucket >= 0) & (bucket < buckets)
+        sums += np.bincount(bucket[valid], weights=chunk.stress()[valid], minlength=buckets)
+        counts += np.bincount(bucket[valid], minlength=buckets)
+
+    width = max(1, int(round(window / step)))
+    sum_totals = np.concatenate(([0.0], np.cumsum(sums)))
+    count_totals = np.concatenate(([0], np.cumsum(counts)))
+    upper = np.arange(1, buckets + 1)
+    lower = np.maximum(upper - width, 0)
+    window_counts = count_totals[upper] - count_totals[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sum_totals[upper] - sum_totals[lower]) / window_counts
+    return {"time": start + upper * step, "mean_stress": mean, "faces": window_counts}
+
+def transitions(store, **filters):
+    """
+    Counts of dominant emotion changes between consecutive faces of the same session, as a
+    {from: {to: count}} matrix. Sessions that span chunks are joined through the last face seen of each.
+    """
+    emotion_count = len(EMOTIONS)
+    counts = np.zeros(emotion_count * emotion_count, dtype=np.int64)
+    last_dominant = np.full(store.sessions, -1, dtype=np.int64)
+    for chunk in store.chunks(**filters):
+        order = np.lexsort((chunk.created, chunk.session))
+        sessions = chunk.session[order]
+        dominant = chunk.dominant()[order]
+        same = sessions[1:] == sessions[:-1]
+        counts += np.bincount(dominant[:-1][same] * emotion_count + dominant[1:][same],
+                              minlength=emotion_count * emotion_count)
+        starts = np.r_[True, ~same]
+        previous = last_dominant[sessions[starts]]
+        carried = previous >= 0
+        counts += np.bincount(previous[carried] * emotion_count + dominant[starts][carried],
+                              minlength=emotion_count * emotion_count)
+        ends = np.r_[~same, True]
+        last_dominant[sessions[ends]] = dominant[ends]
+    counts = counts.reshape(emotion_count, emotion_count)
+    total = int(counts.sum())
+    return {"transitions": total,
+            "change_rate": round(float((total - np.trace(counts)) / total), 4) if total else 0.0,
+            "counts": {source: {target: int(counts[row, column]) for column, target in enumerate(EMOTIONS)}
+                       for row, source in enumerate(EMOTIONS)}}
+
+# --- Throughput benchmark on synthetic data ---
+
+def synthesize(path, faces, sources=16, chunk_rows=CHUNK_ROWS, seed=0):
+    """Fill a column store with `faces` random face records spread over `sources` cameras, one every ~50 ms."""
+    random = np.random.default_rng(seed)
+    store = ColumnStore(path)
+    for source in range(sources):
+        store.source_id(f"live:synthetic-{source}", create=True)
+    created = time.time() - faces * 0.05
+    for offset in range(0, faces, chunk_rows):
+        rows = min(chunk_rows, faces - offset)
+        scores = random.random((rows, len(EMOTIONS)), dtype=np.float32) ** 3
+        emotions = 100 * scores / scores.sum(axis=1, keepdims=True)
+        times = created + np.cumsum(random.exponential(0.05, rows))
+        created = float(times[-1])
+        source = random.integers(0, sources, rows, dtype=np.int32)
+        store.append(emotions, times, source, np.zeros(rows, dtype=np.uint8))
+    return store
+
+def benchmark(faces=10_000_000, chunk_rows=CHUNK_ROWS):
+    """Seconds and faces per second of every analytic over a synthetic memory-mapped dataset."""
+    path = tempfile.mkdtemp(prefix="emotion_analytics_")
+    try:
+        start = time.perf_counter()
+        store = synthesize(path, faces, chunk_rows=chunk_rows)
+        report = {"faces": faces, "chunks": len(store.meta["chunks"]), "sessions": store.sessions,
+                  "write_seconds": round(time.perf_counter() - start, 2)}
+        for name, run in (("summary_by_source", lambda: summary(store, by="source")),
+                          ("summary_by_session", lambda: summary(store, by="session", limit=10)),
+                          ("percentiles", lambda: percentiles(store)),
+                          ("rolling_stress", lambda: rolling_stress(store, window=300, step=60)),
+                          ("transitions", lambda: transitions(store))):
+            start = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - start
+            report[name] = {"seconds": round(seconds, 2), "faces_per_second": int(faces / seconds)}
+        return report
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized analytics over the stored emotion analyses.")
+    parser.add_argument("command", choices=["export", "summary", "percentiles", "rolling", "transitions", "benchmark"])
+    parser.add_argument("--store", default=STORE_PATH, help="results store to export from")
+    parser.add_argument("--path", default=ANALYTICS_PATH, help="column store directory")
+    parser.add_argument("--rebuild", action="store_true", help="export every stored face again")
+    parser.add_argument("--by", choices=GROUPINGS, default="source", help="grouping for 'summary'")
+    parser.add_argument("--limit", type=int, default=20, help="number of groups or windows to print")
+    parser.add_argument("--days", type=float, help="only the last N days")
+    parser.add_argument("--kind", choices=KINDS, help="only live captures, single photos or batch results")
+    parser.add_argument("--source", help="only this source label, as printed by 'summary'")
+    parser.add_argument("--window", type=float, default=300.0, help="rolling window in seconds")
+    parser.add_argument("--step", type=float, default=60.0, help="rolling step in seconds")
+    parser.add_argument("--faces", type=int, default=10_000_000, help="synthetic faces for 'benchmark'")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        print(json.dumps(benchmark(args.faces), indent=2))
+        return
+    if args.command == "export":
+        start = time.perf_counter()
+        exported = export(args.store, args.path, rebuild=args.rebuild)
+        print(f"Exported {exported} faces in {time.perf_counter() - start:.1f}s to {args.path}")
+        return
+
+    store = ColumnStore(args.path)
+    filters = {"kind": args.kind, "source": args.source,
+               "since": time.time() - args.days * 86400 if args.days is not None else None}
+    if args.command == "summary":
+        for row in summary(store, by=args.by, limit=args.limit, **filters):
+            print(json.dumps(row))
+    elif args.command == "percentiles":
+        print(json.dumps(percentiles(store, **filters), indent=2))
+    elif args.command == "transitions":
+        print(json.dumps(transitions(store, **filters), indent=2))
+    else:
+        series = rolling_stress(store, window=args.window, step=args.step, **filters)
+        filled = np.flatnonzero(series["faces"])
+        for index in filled[np.argsort(-series["mean_stress"][filled], kind="stable")][:args.limit].tolist():
+            print(json.dumps({"window_end": float(series["time"][index]),
+                              "mean_stress": round(float(series["mean_stress"][index]), 2),
+                              "faces": int(series["faces"][index])}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import threading
+import numpy as np
+
+# Which engine classifies the face crops: "deepface" (Keras/TensorFlow) or "onnx" (ONNX Runtime, INT8)
+BACKEND = os.environ.get("EMOTION_BACKEND", "deepface")
+ONNX_MODEL_PATH = os.environ.get("EMOTION_ONNX_MODEL", os.path.join("models", "emotion_int8.onnx"))
+INPUT_SHAPE = (48, 48, 1)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+class DeepFaceBackend:
+    """DeepFace's Keras emotion model, run by TensorFlow."""
+
+    name = "deepface"
+
+    def __init__(self):
+        from face_pipeline import load_emotion_model
+        self.model = load_emotion_model()
+
+    def predict(self, batch):
+        """Emotion probabilities for a (N, 48, 48, 1) float32 batch of grayscale faces."""
+        return np.asarray(self.model.predict(batch, verbose=0), dtype=np.float32)
+
+class OnnxBackend:
+    """
+    The same emotion model exported to ONNX and quantized to INT8, run by ONNX Runtime on the CPU.
+    Create the model file with `python emotion_backends.py export`.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The onnx backend needs onnxruntime (pip install onnxruntime).")
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"ONNX emotion model not found at {model_path}; "
+                               f"create it with 'python emotion_backends.py export'.")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+BACKENDS = {DeepFaceBackend.name: DeepFaceBackend, OnnxBackend.name: OnnxBackend}
+
+def backend_name():
+    return BACKEND
+
+def get_backend():
+    """The configured backend, loaded on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown emotion backend {BACKEND!r}; choose one of {', '.join(BACKENDS)}")
+            _backend = BACKENDS[BACKEND]()
+    return _backend
+
+# --- Export, parity check and comparison ---
+
+def dataset_batches(folder_path):
+    """Yield (image name, model input batch) for every image in a folder, with the faces detected once."""
+    import cv2
+    import face_pipeline
+
+    for name in sorted(os.listdir(folder_path)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            continue
+        image = cv2.imread(os.path.join(folder_path, name))
+        if image is None:
+            continue
+        faces = [item["face"] for item in face_pipeline.detect_faces(image)]
+        if not faces:
+            continue
+        yield name, np.stack([face_pipeline.to_model_input(face) for face in faces])[..., np.newaxis]
+
+class CalibrationReader:
+    """Feeds dataset faces to ONNX Runtime's static quantization to calibrate the activation ranges."""
+
+    def __init__(self, folder_path, input_name):
+        self.batches = (batch for _, batch in dataset_batches(folder_path))
+        self.input_name = input_name
+
+    def get_next(self):
+        batch = next(self.batches, None)
+        return None if batch is None else {self.input_name: batch.astype(np.float32)}
+
+def export(output_path=ONNX_MODEL_PATH, calibration_folder="dataset"):
+    """
+    Convert DeepFace's Keras emotion model to ONNX and quantize it to INT8.
+    Uses static quantization calibrated on `calibration_folder` when it exists, dynamic quantization otherwise.
+    Needs tf2onnx and onnxruntime.
+    """
+    import tensorflow as tf
+    import tf2onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic, quantize_static
+    from face_pipeline import load_emotion_model
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    float_path = os.path.splitext(output_path)[0] + "_fp32.onnx"
+    signature = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name="faces"),)
+    tf2onnx.convert.from_keras(load_emotion_model(), input_signature=signature, opset=13, output_path=float_path)
+
+    if calibration_folder and os.path.isdir(calibration_folder):
+        quantize_static(float_path, output_path, CalibrationReader(calibration_folder, "faces"),
+                        weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    else:
+        quantize_dynamic(float_path, output_path, weight_type=QuantType.QInt8)
+    print(f"Exported {float_path} and INT8 model {output_path}")
+    return output_path
+
+def parity(folder_path="dataset", model_path=ONNX_MODEL_PATH):
+    """Compare the ONNX backend with DeepFace on the same detected faces: dominant emotion agreement and score drift."""
+    reference, candidate = DeepFaceBackend(), OnnxBackend(model_path)
+    faces = agreements = 0
+    drifts = []
+    for name, batch in dataset_batches(folder_path):
+        expected = 100 * reference.predict(batch)
+        actual = 100 * candidate.predict(batch)
+        agree = int((expected.argmax(axis=1) == actual.argmax(axis=1)).sum())
+        drift = np.abs(expected - actual)
+        faces += len(batch)
+        agreements += agree
+        drifts.append(drift)
+        print(json.dumps({"image": name, "faces": len(batch), "dominant_agreement": agree,
+                          "max_drift_points": float(drift.max())}))
+    drift = np.concatenate(drifts) if drifts else np.zeros((0, 7))
+    report = {"faces": faces, "dominant_agreement": agreements / faces if faces else 1.0,
+              "mean_drift_points": float(drift.mean()) if drift.size else 0.0,
+              "p99_drift_points": float(np.percentile(drift, 99)) if drift.size else 0.0,
+              "max_drift_points": float(drift.max()) if drift.size else 0.0}
+    print(json.dumps(report))
+    return report
+
+def peak_rss():
+    """Peak resident set size of this process in MB, or None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def save_batches(folder_path, batches_path):
+    """Detect the dataset faces once and save the model input batches, so measure() can run without the detector."""
+    batches = [batch for _, batch in dataset_batches(folder_path)]
+    if not batches:
+        raise ValueError(f"No faces detected in the images in {folder_path}")
+    np.savez(batches_path, *batches)
+
+def measure(backend_name, folder_path, repeats, model_path=ONNX_MODEL_PATH, batches_path=None):
+    """
+    Load one backend and time it on the dataset faces; meant to run in a fresh process for clean memory numbers.
+    With `batches_path` (from save_batches) the faces are loaded from disk, so neither TensorFlow nor the
+    detector is in the process before the backend loads. Otherwise they are detected here first and the
+    memory that took is reported separately as detection_memory_mb.
+    """
+    start_rss = peak_rss()
+    if batches_path:
+        with np.load(batches_path) as saved:
+            batches = [saved[name] for name in saved.files]
+    else:
+        batches = [batch for _, batch in dataset_batches(folder_path)]
+    if not batches:
+        raise ValueError(f"No faces detected in the images in {folder_path}")
+    before = peak_rss()
+    start = time.perf_counter()
+    backend = OnnxBackend(model_path) if backend_name == OnnxBackend.name else BACKENDS[backend_name]()
+    backend.predict(batches[0])  # Warm up
+    load_seconds = time.perf_counter() - start
+    timings = []
+    for _ in range(repeats):
+        for batch in batches:
+            start = time.perf_counter()
+            backend.predict(batch)
+            timings.append((time.perf_counter() - start) / len(batch))
+    peak = peak_rss()
+    report = {"backend": backend_name, "load_seconds": load_seconds,
+              "p50_ms_per_face": 1000 * float(np.percentile(timings, 50)),
+              "p90_ms_per_face": 1000 * float(np.percentile(timings, 90))}
+    if peak is not None:
+        report.update({"model_memory_mb": peak - before, "detection_memory_mb": before - start_rss, "peak_rss_mb": peak})
+    return report
+
+def compare(folder_path="dataset", repeats=5, model_path=ONNX_MODEL_PATH):
+    """
+    Latency and memory of every backend, each measured in its own process on faces detected once
+    beforehand in yet another process, so no backend's numbers include TensorFlow unless it uses it.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        batches_path = os.path.join(directory, "batches.npz")
+        result = subprocess.run([sys.executable, __file__, "prepare", folder_path, "--batches", batches_path],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not prepare the face batches: {result.stderr.strip()[-500:]}")
+        report = []
+        for name in BACKENDS:
+            result = subprocess.run([sys.executable, __file__, "measure", folder_path, "--backend", name,
+                                     "--repeats", str(repeats), "--model", model_path, "--batches", batches_path],
+                                    capture_output=True, text=True)
+            lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+            row = json.loads(lines[-1]) if lines else {"backend": name, "error": result.stderr.strip()[-500:]}
+            print(json.dumps(row))
+            report.append(row)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Emotion classification backends: export, parity check and comparison.")
+    parser.add_argument("command", choices=["export", "parity", "compare", "measure", "prepare"])
+    parser.add_argument("folder", nargs="?", default="dataset", help="images used for calibration, parity and timing")
+    parser.add_argument("--model", default=ONNX_MODEL_PATH, help="path of the INT8 ONNX model")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="deepface", help="backend for 'measure'")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batches", help="saved face batches for 'measure' (written by 'prepare')")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            export(args.model, args.folder)
+        elif args.command == "parity":
+            parity(args.folder, args.model)
+        elif args.command == "compare":
+            compare(args.folder, args.repeats, args.model)
+        elif args.command == "prepare":
+            save_batches(args.folder, args.batches or "batches.npz")
+        else:
+            print(json.dumps(measure(args.backend, args.folder, args.repeats, args.model, args.batches)))
+    except (ValueError, RuntimeError) as e:
+        raise SystemExit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
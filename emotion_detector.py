@@ -1,27 +1,40 @@
+import time
+PROCESS_START = time.perf_counter()
+
 import cv2
-from deepface import DeepFace
 import os
+import json
+import argparse
 from datetime import datetime
 import platform
 import subprocess
 import random
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
 import threading
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
+import inference_server
+import results_store
+import metrics
+from overlay import Overlay
+from capture_writer import CaptureWriter
+from text_sprites import SpriteCache, blit, draw_label
+from live_analysis import LatestFrameSlot, LiveAnalyzer, RateMeter
+from face_tracking import FaceTracker
+from camera_capture import CameraCapture
+from tk_display import FrameDisplay, next_frame_delay
+from events import EventSender, MODEL_LOADED, CAMERA_OPEN, FIRST_FRAME, ERROR, EXIT
 
 # Ensure the "captures" directory exists
 os.makedirs("captures", exist_ok=True)
 
-SIGNAL_FILE = "camera_ready.signal"
+# Quote layout used on the live feed
+QUOTE_FONT_SCALE = 0.7
+QUOTE_COLOR = (0, 255, 255)
+QUOTE_MAX_WIDTH = 400
 
-def setup_camera_signal():
-    if os.path.exists(SIGNAL_FILE):
-        os.remove(SIGNAL_FILE)
-    with open(SIGNAL_FILE, "w") as f:
-        f.write("Camera is ready")
+sprites = SpriteCache()
 
 def load_quotes(file_path="quotes.txt"):
     quotes = {}
@@ -67,51 +80,33 @@ def apply_face_highlight(frame, region):
     cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 255), 2)
     return frame
 
-def draw_text_with_background(frame, text, position, font_scale=0.6, color=(255, 255, 255), bg_color=(0, 0, 0), thickness=1):
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    text_size = cv2.getTextSize(text, font, font_scale, thickness)[0]
-    text_x, text_y = position
-    box_coords = ((text_x, text_y + 5), (text_x + text_size[0] + 10, text_y - text_size[1] - 5))
-    cv2.rectangle(frame, box_coords[0], box_coords[1], bg_color, cv2.FILLED)
-    cv2.putText(frame, text, (text_x + 5, text_y), font, font_scale, color, thickness, cv2.LINE_AA)
+def draw_text_with_background(frame, text, position, font_scale=0.6, color=(255, 255, 255), bg_color=(0, 0, 0), thickness=1, overlay=None, cached=True):
+    # Labels repeat from frame to frame, so they are rendered once and blitted from the sprite cache;
+    # text that changes nearly every frame (rates, timings) is drawn directly so it does not evict them
+    if not cached:
+        draw_label(frame, text, position, font_scale, color, bg_color, thickness)
+        return
+    sprite = sprites.label(text, font_scale, color, bg_color, thickness)
+    if overlay is not None:
+        overlay.sprite(sprite, position)
+    else:
+        blit(frame, sprite, position)
 
 def draw_wrapped_text_with_background(frame, text, position, font_scale=0.6, color=(255, 255, 255), max_width=400):
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    words = text.split(' ')
-    lines = []
-    current_line = ''
-
-    for word in words:
-        test_line = f"{current_line} {word}".strip()
-        text_size = cv2.getTextSize(test_line, font, font_scale, 1)[0]
-        if text_size[0] > max_width:
-            lines.append(current_line)
-            current_line = word
-        else:
-            current_line = test_line
-    lines.append(current_line)
-
-    x, y = position
-    for line in lines:
-        text_size = cv2.getTextSize(line, font, font_scale, 1)[0]
-        box_coords = ((x, y + 5), (x + text_size[0] + 10, y - text_size[1] - 5))
-        cv2.rectangle(frame, box_coords[0], box_coords[1], (0, 0, 0), cv2.FILLED)
-        cv2.putText(frame, line, (x + 5, y), font, font_scale, color, 1, cv2.LINE_AA)
-        y += text_size[1] + 10
+    blit(frame, sprites.wrapped(text, font_scale, color, max_width), position)
 
 def draw_face_box_and_emotions(image, analysis):
     """Draw bounding boxes, display emotions, and stress grade on the image."""
+    overlay = Overlay()
     for face in analysis:
         region = face.get('region', None)
         if region:
             x, y, w, h = region['x'], region['y'], region['w'], region['h']
 
             # Draw bounding box with semi-transparent overlay
-            overlay = image.copy()
-            cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), -1)
             alpha = 0.3
-            cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0, image)
-            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            overlay.rectangle((x, y), (x + w, y + h), (0, 255, 0), alpha=alpha)
+            overlay.rectangle((x, y), (x + w, y + h), (0, 255, 0), thickness=2)
 
             font_scale = 0.6
             thickness = 1
@@ -120,62 +115,185 @@ def draw_face_box_and_emotions(image, analysis):
             emotions = face.get('emotion', {})
             sorted_emotions = sorted(emotions.items(), key=lambda x: x[1], reverse=True)
 
-            negative_emotions = ["angry", "disgust", "fear", "sad"]
-            stress_grade = sum(emotions.get(emotion, 0) for emotion in negative_emotions)
-            stress_grade = min(max(stress_grade, 0), 100)
+            stress_grade = results_store.stress_grade(emotions)
 
-            draw_text_with_background(image, f"Dominant: {dominant_emotion}", (x, y - 30), font_scale=font_scale, color=(0, 255, 0))
+            draw_text_with_background(image, f"Dominant: {dominant_emotion}", (x, y - 30), font_scale=font_scale, color=(0, 255, 0), overlay=overlay)
 
             y_offset = y + h + 20
             for emotion, score in sorted_emotions:
-                draw_text_with_background(image, f"{emotion.capitalize()}: {score:.1f}%", (x, y_offset), font_scale=font_scale, color=(255, 255, 255))
+                draw_text_with_background(image, f"{emotion.capitalize()}: {score:.1f}%", (x, y_offset), font_scale=font_scale, color=(255, 255, 255), overlay=overlay)
                 y_offset += int(25 * font_scale)
 
-            draw_text_with_background(image, f"Stress Grade: {stress_grade:.1f}%", (x, y_offset), font_scale=font_scale, color=(255, 165, 0))
+            draw_text_with_background(image, f"Stress Grade: {stress_grade:.1f}%", (x, y_offset), font_scale=font_scale, color=(255, 165, 0), overlay=overlay)
 
-def scan_emotion_live(frame, quotes):
-    try:
-        analysis = DeepFace.analyze(img_path=frame, actions=['emotion'], enforce_detection=False)
-        if isinstance(analysis, list):
-            analysis = analysis[0]
+    overlay.render(image)
 
-        dominant_emotion = analysis.get('dominant_emotion', 'unknown')
+def draw_analysis(frame, faces, quote):
+    """Draw the face highlights, emotion breakdowns and quote for an analysis result."""
+    for face in faces:
+        if 'region' in face:
+            frame = apply_face_highlight(frame, face['region'])
+    draw_face_box_and_emotions(frame, faces)
+    draw_wrapped_text_with_background(frame, quote, (10, 40), font_scale=QUOTE_FONT_SCALE, color=QUOTE_COLOR, max_width=QUOTE_MAX_WIDTH)
 
-        if 'region' in analysis:
-            frame = apply_face_highlight(frame, analysis['region'])
-        draw_face_box_and_emotions(frame, [analysis])
+def analyze_frame(frame):
+    with metrics.span("analyze"):
+        return inference_server.analyze(frame, inference_server.LIVE)
 
-        quote = get_quote(dominant_emotion, quotes)
-        draw_wrapped_text_with_background(frame, quote, (10, 40), font_scale=0.7, color=(0, 255, 255))
+def draw_stats(frame):
+    """Draw the collected timings in the bottom-right corner of the frame."""
+    lines = metrics.format_stats()
+    x = max(frame.shape[1] - 330, 0)
+    y = frame.shape[0] - 15 - 20 * (len(lines) - 1)
+    for line in lines:
+        draw_text_with_background(frame, line, (x, y), font_scale=0.4, color=(255, 255, 255), cached=False)
+        y += 20
+
+def scan_emotion_live(frame, quotes):
+    """Analyze and annotate a frame in place; returns the faces and quote, or None when the analysis failed."""
+    try:
+        faces = analyze_frame(frame)
+        quote = get_quote(faces[0].get('dominant_emotion', 'unknown'), quotes)
+        with metrics.span("overlay_draw"):
+            draw_analysis(frame, faces, quote)
+        return faces, quote
 
     except Exception as e:
         print(f"Error detecting emotion: {e}")
+        return None
 
-import ttkbootstrap as tb
-from ttkbootstrap.constants import *
+def start_camera_ui(startup_benchmark=False, events=None, camera_source=0):
+    events = events or EventSender()
 
-def start_camera_ui():
     def update_frame():
-        nonlocal frame_original, scanning
-        if not running or scanning:
-            return  # Stop updating frames when scanning
-
-        ret, frame = cap.read()
-        if not ret:
+        nonlocal frame_original, scanning, held_frame, display_buffer
+        if not running or scanning or camera is None:
+            return  # Stop updating frames when scanning or when the camera could not be opened
+
+        # Frames are read on the capture thread; take the newest one without waiting for the camera
+        captured = camera.ring.borrow(latest=True)
+        if captured is None:
+            if camera.finished.is_set():
+                if "first_frame" not in startup_times:
+                    events.send(ERROR, source="camera", message="The camera isn't delivering frames.")
+                return
+            video_label.after(2, update_frame)
             return
-
-        frame_original = frame.copy()
+        if "first_frame" not in startup_times:
+            events.send(FIRST_FRAME)
+            record_startup("first_frame")
+            if not running:
+                camera.ring.release(captured)
+                return  # The startup benchmark has finished
+
+        # Keep the borrowed buffer untouched as the scan source until the next frame replaces it,
+        # and draw the overlays on a reused display buffer
+        if held_frame is not None:
+            camera.ring.release(held_frame)
+        held_frame = captured
+        frame_original = captured.image
+        if display_buffer is None or display_buffer.shape != frame_original.shape:
+            display_buffer = frame_original.copy()
+        else:
+            display_buffer[...] = frame_original
+        frame = display_buffer
+        display_meter.tick()
+
+        if live_mode:
+            faces = live_faces(frame_original)
+            with metrics.span("overlay_draw"):
+                if faces:
+                    draw_analysis(frame, faces, live_quote(faces))
+                draw_text_with_background(frame, f"Display: {display_meter.rate():.1f} FPS | Inference: {analyzer.meter.rate():.1f} FPS",
+                                          (10, frame.shape[0] - 15), font_scale=0.5, color=(0, 255, 0), cached=False)
+        if metrics.overlay_enabled():
+            draw_stats(frame)
 
         # Show the normal live feed
-        frame_rgb = cv2.cvtColor(frame_original, cv2.COLOR_BGR2RGB)
-        frame_pil = Image.fromarray(frame_rgb)
-        frame_tk = ImageTk.PhotoImage(image=frame_pil)
-
-        video_label.imgtk = frame_tk
-        video_label.configure(image=frame_tk)
+        with metrics.span("photoimage"):
+            display.show(frame)
+
+        # Come back when the camera should have delivered the next frame
+        video_label.after(next_frame_delay(captured.timestamp, camera.meter.rate()), update_frame)
+
+    def live_faces(frame):
+        """Hand frames to the inference worker and return the faces to overlay on this one."""
+        nonlocal seen_results
+        count, result, analyzed_frame = analyzer.latest()
+        # The inference worker gets its own copy: the camera buffer goes back to the capture ring
+        if not tracking_var.get():
+            frame_slot.put(frame.copy())
+            return result or []
+
+        # Detect every N frames (or when tracking degrades); follow the faces with optical flow in between
+        if count != seen_results:
+            seen_results = count
+            # Seed on the frame the detection ran on, then follow the faces forward to this one
+            tracker.update_detections(result, analyzed_frame, frame)
+        else:
+            tracker.propagate(frame)
+        if tracker.needs_detection():
+            frame_slot.put(frame.copy())
+            tracker.mark_detection_requested()
+        return tracker.faces()
+
+    def live_quote(faces):
+        """Keep the quote steady until the dominant emotion of the first face changes."""
+        nonlocal quote_emotion, quote
+        dominant_emotion = faces[0].get('dominant_emotion', 'unknown')
+        if dominant_emotion != quote_emotion:
+            quote_emotion = dominant_emotion
+            quote = get_quote(dominant_emotion, quotes)
+        return quote
+
+    def record_startup(event):
+        startup_times[event] = time.perf_counter() - PROCESS_START
+        if startup_benchmark and {"first_frame", "model_ready"} <= startup_times.keys():
+            print(json.dumps({f"{name}_seconds": seconds for name, seconds in startup_times.items()}), flush=True)
+            on_quit()
+
+    def load_model():
+        """Import DeepFace and warm the model off the Tk thread."""
+        try:
+            inference_server.prepare(inference_server.LIVE)
+            events.send(MODEL_LOADED)
+        except Exception as e:
+            print(f"Error loading emotion model: {e}")
+            events.send(ERROR, source="model", message=str(e))
+        model_ready.set()
+
+    def open_camera():
+        nonlocal camera
+        cap = cv2.VideoCapture(camera_source)
+        if cap.isOpened():
+            # Video files stand in for a camera at their own frame rate
+            fps = (cap.get(cv2.CAP_PROP_FPS) or 30.0) if isinstance(camera_source, str) else None
+            camera = CameraCapture(cap, fps=fps)
+            camera.start()
+            events.send(CAMERA_OPEN)
+        else:
+            events.send(ERROR, source="camera", message="The camera could not be opened.")
+        camera_opened.set()
 
-        # Update frame every 15ms (~60 FPS)
-        video_label.after(15, update_frame)
+    def wait_for_startup():
+        """Start the feed once the camera is open and unlock the analysis buttons once the model is warm."""
+        nonlocal feed_started, buttons_unlocked
+        if not running:
+            return
+        if camera_opened.is_set() and not feed_started:
+            feed_started = True
+            update_frame()
+        if model_ready.is_set() and not buttons_unlocked:
+            buttons_unlocked = True
+            loading_progress.stop()
+            loading_progress.pack_forget()
+            loading_label.pack_forget()
+            scan_button.config(state=NORMAL)
+            live_button.config(state=NORMAL)
+            record_startup("model_ready")
+        # Either may finish first: a warm inference server answers long before the camera opens
+        if not (feed_started and buttons_unlocked):
+            root.after(100, wait_for_startup)
 
     def on_scan():
         nonlocal scanning, frame_original
@@ -185,24 +303,23 @@ def start_camera_ui():
             # Analyze emotions on the current frame
             frame_to_analyze = frame_original.copy()
             try:
-                scan_emotion_live(frame_to_analyze, quotes)
+                result = scan_emotion_live(frame_to_analyze, quotes)
 
-                # Save the processed frame
+                # Save the processed frame; the encode and write happen on the capture writer thread
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"captures/emotion_capture_{timestamp}.jpg"
-                cv2.imwrite(filename, frame_to_analyze)
-                print(f"Capture saved as {filename}")
+                metadata = {"time": timestamp, "faces": result[0], "quote": result[1]} if result else None
+                filename = capture_writer.submit(frame_to_analyze, f"captures/emotion_capture_{timestamp}.jpg",
+                                                 metadata, block=False)
+                if filename:
+                    print(f"Saving capture as {filename}")
+                if result:
+                    results_store.get_store().record(result[0], "live", source=str(camera_source), capture_path=filename)
 
             except Exception as e:
                 print(f"Error during emotion detection: {e}")
 
             # Display the processed frame with emotions
-            frame_rgb = cv2.cvtColor(frame_to_analyze, cv2.COLOR_BGR2RGB)
-            frame_pil = Image.fromarray(frame_rgb)
-            frame_tk = ImageTk.PhotoImage(image=frame_pil)
-
-            video_label.imgtk = frame_tk
-            video_label.configure(image=frame_tk)
+            display.show(frame_to_analyze)
 
             scan_button.config(state=DISABLED)
             reset_button.config(state=NORMAL)
@@ -214,10 +331,30 @@ def start_camera_ui():
         reset_button.config(state=DISABLED)
         update_frame()  # Resume live feed
 
+    def on_live():
+        nonlocal live_mode, analyzer
+        live_mode = not live_mode
+        if live_mode:
+            if analyzer is None:
+                analyzer = LiveAnalyzer(analyze_frame, frame_slot)
+                analyzer.start()
+            live_button.config(text="Stop Live")
+            scan_button.config(state=DISABLED)
+        else:
+            live_button.config(text="Live")
+            scan_button.config(state=NORMAL)
+
     def on_quit():
         nonlocal running
         running = False
-        cap.release()
+        if analyzer is not None:
+            analyzer.stop()
+        if camera is not None:
+            camera.stop()
+        capture_writer.flush()
+        metrics.flush()
+        events.send(EXIT)
+        events.close()
         root.destroy()
 
     # Initialize the root window
@@ -232,29 +369,69 @@ def start_camera_ui():
 
     video_label = tb.Label(video_frame, text="Initializing camera...", anchor="center", bootstyle="secondary-inverse")
     video_label.pack(fill=BOTH, expand=True, padx=10, pady=10)
+    display = FrameDisplay(video_label)
 
     # Button frame
     button_frame = tb.Frame(root, bootstyle="dark")
     button_frame.pack(side=BOTTOM, fill=X, pady=20)
 
     # Styled buttons
-    scan_button = tb.Button(button_frame, text="Scan", command=on_scan, bootstyle="primary-outline", width=10)
+    scan_button = tb.Button(button_frame, text="Scan", command=on_scan, state=DISABLED, bootstyle="primary-outline", width=10)
     scan_button.pack(side=LEFT, padx=15, pady=5)
 
     reset_button = tb.Button(button_frame, text="Reset", command=on_reset, state=DISABLED, bootstyle="warning-outline", width=10)
     reset_button.pack(side=LEFT, padx=15, pady=5)
 
+    live_button = tb.Button(button_frame, text="Live", command=on_live, state=DISABLED, bootstyle="success-outline", width=10)
+    live_button.pack(side=LEFT, padx=15, pady=5)
+
+    tracking_var = tk.BooleanVar(value=True)
+    tracking_check = tb.Checkbutton(button_frame, text="Smooth tracking", variable=tracking_var, bootstyle="success-round-toggle")
+    tracking_check.pack(side=LEFT, padx=15, pady=5)
+
     quit_button = tb.Button(button_frame, text="Quit", command=on_quit, bootstyle="danger-outline", width=10)
     quit_button.pack(side=LEFT, padx=15, pady=5)
 
-    # Camera initialization
-    cap = cv2.VideoCapture(0)
+    # Scan and Live stay disabled until the model has been loaded in the background
+    loading_label = tb.Label(button_frame, text="Loading emotion model...", bootstyle="info")
+    loading_label.pack(side=LEFT, padx=15, pady=5)
+    loading_progress = tb.Progressbar(button_frame, mode="indeterminate", bootstyle="info-striped", length=150)
+    loading_progress.pack(side=LEFT, padx=5, pady=5)
+    loading_progress.start(15)
+
+    root.update_idletasks()
+    startup_times = {}
+    record_startup("window")
+
+    # Open the camera and warm the model off the Tk thread so the window is responsive right away
+    camera = None
+    held_frame = None
+    display_buffer = None
+    camera_opened = threading.Event()
+    model_ready = threading.Event()
+    feed_started = False
+    buttons_unlocked = False
+    threading.Thread(target=open_camera, daemon=True).start()
+    threading.Thread(target=load_model, daemon=True).start()
+
+    capture_writer = CaptureWriter.from_environment(image_format="jpg")
     quotes = load_quotes()
+    sprites.prefill_quotes(quotes, QUOTE_FONT_SCALE, QUOTE_COLOR, QUOTE_MAX_WIDTH)
     running = True
     scanning = False
     frame_original = None
 
-    update_frame()  # Start updating frames
+    # Continuous live analysis: the worker picks up the newest frame, the display never waits for it
+    live_mode = False
+    frame_slot = LatestFrameSlot()
+    analyzer = None
+    display_meter = RateMeter()
+    tracker = FaceTracker()
+    seen_results = 0
+    quote_emotion = None
+    quote = ""
+
+    wait_for_startup()  # Starts updating frames once the camera is open
     root.mainloop()
 
 
@@ -264,5 +441,13 @@ def start_camera_ui():
 
 
 if __name__ == "__main__":
-    setup_camera_signal()
-    start_camera_ui()
+    parser = argparse.ArgumentParser(description="Live emotion detection from the webcam.")
+    parser.add_argument("--startup-benchmark", action="store_true",
+                        help="print window, first-frame and model-ready times as JSON, then exit")
+    parser.add_argument("--events-port", type=int, help="localhost port of the launcher's readiness channel")
+    parser.add_argument("--camera", default="0", help="camera index, or a video file to use instead of a camera")
+    args = parser.parse_args()
+
+    metrics.enable_from_environment()
+    camera_source = int(args.camera) if args.camera.isdigit() else args.camera
+    start_camera_ui(startup_benchmark=args.startup_benchmark, events=EventSender(args.events_port), camera_source=camera_source)
@@ -0,0 +1,92 @@
+import json
+import queue
+import socket
+import threading
+
+# Events the live window reports to the launcher, in the order they normally happen
+MODEL_LOADED = "model-loaded"
+CAMERA_OPEN = "camera-open"
+FIRST_FRAME = "first-frame"
+ERROR = "error"
+EXIT = "exit"
+EVENT_TYPES = (MODEL_LOADED, CAMERA_OPEN, FIRST_FRAME, ERROR, EXIT)
+
+class EventListener:
+    """
+    Launcher side of the readiness channel: a localhost socket the child process connects back to.
+    Received events are queued as dicts ({"event": ..., plus any extra fields}) for the Tk thread to poll;
+    a lost connection is reported as an EXIT event.
+    """
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.events = queue.Queue()
+        self.connected = False
+        threading.Thread(target=self.run, name="event-listener", daemon=True).start()
+
+    def run(self):
+        try:
+            connection, _ = self.server.accept()
+        except OSError:
+            return  # Closed before the child connected
+        finally:
+            self.server.close()
+        self.connected = True
+        with connection, connection.makefile("r", encoding="utf-8") as stream:
+            try:
+                for line in stream:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.events.put(event)
+                    if event.get("event") == EXIT:
+                        return
+            except OSError:
+                pass
+        self.events.put({"event": EXIT})
+
+    def poll(self):
+        """Return every event received since the last call, without blocking."""
+        received = []
+        while True:
+            try:
+                received.append(self.events.get_nowait())
+            except queue.Empty:
+                return received
+
+    def close(self):
+        self.server.close()
+
+class EventSender:
+    """Child side of the readiness channel; does nothing when no launcher is listening."""
+
+    def __init__(self, port=None):
+        self.sock = None
+        self.lock = threading.Lock()
+        if port:
+            try:
+                self.sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+            except OSError as e:
+                print(f"Could not connect to the launcher: {e}")
+
+    def send(self, event, **fields):
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Unknown event: {event}")
+        if self.sock is None:
+            return
+        message = (json.dumps(dict(fields, event=event)) + "\n").encode("utf-8")
+        with self.lock:
+            try:
+                self.sock.sendall(message)
+            except OSError:
+                self.sock = None  # Launcher is gone; keep running without it
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
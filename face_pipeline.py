@@ -0,0 +1,321 @@
+import os
+import time
+import json
+import argparse
+import threading
+from importlib import metadata
+import cv2
+import numpy as np
+
+import emotion_backends
+
+# Suppress TensorFlow logging messages
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+
+# DeepFace settings used for every analysis; part of the result cache key
+MODEL_NAME = "Emotion"
+DETECTOR_BACKEND = "opencv"
+def parse_detection_sizes(text):
+    """Parse "640,1280,full" into (640, 1280, None)."""
+    return tuple(None if size.strip() == "full" else int(size) for size in text.split(",") if size.strip())
+
+# Longest side of the detection pyramid levels, smallest first; None means the full image.
+# One level by default, so an image without faces costs a single downscaled pass; opt in to retrying
+# larger levels when nothing is found with e.g. EMOTION_DETECTION_SIZES=640,1280,full
+DETECTION_SIZES = parse_detection_sizes(os.environ.get("EMOTION_DETECTION_SIZES", "640"))
+
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+EMOTION_INPUT_SIZE = 48
+
+_deepface = None
+_deepface_lock = threading.Lock()
+_emotion_model = None
+_model_lock = threading.Lock()
+
+def jsonable(value):
+    """Convert DeepFace output (numpy scalars, nested dicts/lists) into plain JSON types."""
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def deepface_version():
+    try:
+        return metadata.version("deepface")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def load_deepface():
+    """Import DeepFace (and TensorFlow) on first use only."""
+    global _deepface
+    with _deepface_lock:
+        if _deepface is None:
+            from deepface import DeepFace
+            _deepface = DeepFace
+    return _deepface
+
+def load_emotion_model():
+    """Return the Keras emotion classifier behind DeepFace, building it on first use."""
+    global _emotion_model
+    with _model_lock:
+        if _emotion_model is None:
+            DeepFace = load_deepface()
+            try:
+                client = DeepFace.build_model(task="facial_attribute", model_name=MODEL_NAME)
+            except TypeError:
+                client = DeepFace.build_model(MODEL_NAME)  # DeepFace < 0.0.93
+            _emotion_model = getattr(client, "model", client)
+    return _emotion_model
+
+def extract_faces(image, detector=DETECTOR_BACKEND):
+    """Run one of DeepFace's detectors on a BGR image and return its extracted faces."""
+    DeepFace = load_deepface()
+    return DeepFace.extract_faces(img_path=image, detector_backend=detector,
+                                  enforce_detection=False, align=True)
+
+def align_crop(crop, region):
+    """Rotate a face crop so the eyes are level, the same way DeepFace aligns its detections."""
+    left_eye, right_eye = region.get("left_eye"), region.get("right_eye")
+    if not left_eye or not right_eye:
+        return crop
+    angle = float(np.degrees(np.arctan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0])))
+    height, width = crop.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(crop, matrix, (width, height))
+
+def scale_region(region, scale):
+    """Map a facial_area found on a resized copy back to original image coordinates."""
+    mapped = {}
+    for key, value in region.items():
+        if key in ("x", "y", "w", "h"):
+            mapped[key] = int(round(value / scale))
+        elif isinstance(value, (list, tuple)):
+            mapped[key] = tuple(int(round(coordinate / scale)) for coordinate in value)
+        else:
+            mapped[key] = value
+    return mapped
+
+def detect_faces(image, detection_sizes=DETECTION_SIZES, detector=DETECTOR_BACKEND):
+    """
+    Detect faces on downscaled copies of an image and crop them from the full-resolution original.
+    Args:
+        image: An image path or BGR array.
+        detection_sizes: Longest-side sizes to try, smallest first. The first level that finds a face wins,
+            so every extra level is paid for on images without faces; None runs the detector on the full image.
+        detector: The DeepFace detector backend to use.
+    Returns:
+        DeepFace-style extracted faces: 'face' (RGB floats in [0, 1]), 'facial_area' in original
+        coordinates and 'confidence'.
+    """
+    if isinstance(image, str):
+        path, image = image, cv2.imread(image)
+        if image is None:
+            raise ValueError(f"Error loading image {path}.")
+    height, width = image.shape[:2]
+
+    for size in detection_sizes:
+        scale = 1.0 if size is None else min(1.0, size / max(height, width))
+        small = image if scale == 1.0 else cv2.resize(image, (int(width * scale), int(height * scale)),
+                                                      interpolation=cv2.INTER_AREA)
+        detected = [item for item in extract_faces(small, detector) if item.get("confidence", 0) > 0]
+        if detected:
+            break
+        if scale == 1.0:
+            break  # Larger levels would only repeat the full-resolution pass
+    else:
+        detected = []
+
+    if not detected:
+        # Same fallback as DeepFace with enforce_detection=False: the whole image, zero confidence
+        # (shrunk first: the emotion model only needs 48x48 and full-size float copies are huge)
+        factor = min(1.0, 224 / max(height, width))
+        thumbnail = cv2.resize(image, (max(1, int(width * factor)), max(1, int(height * factor))),
+                               interpolation=cv2.INTER_AREA)
+        face = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+        return [{"face": face, "facial_area": {"x": 0, "y": 0, "w": width, "h": height}, "confidence": 0}]
+
+    if scale == 1.0:
+        return detected
+
+    faces = []
+    for item in detected:
+        region = scale_region(item["facial_area"], scale)
+        x, y = max(region["x"], 0), max(region["y"], 0)
+        crop = image[y:y + region["h"], x:x + region["w"]]
+        if crop.size == 0:
+            continue
+        face = cv2.cvtColor(align_crop(crop, region), cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+        faces.append({"face": face, "facial_area": region, "confidence": item.get("confidence", 0)})
+    return faces
+
+def to_model_input(face):
+    """Letterbox a face crop to a square, convert it to grayscale and scale it to the emotion model's input size."""
+    face = np.asarray(face, dtype=np.float32)
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    height, width = face.shape[:2]
+    factor = EMOTION_INPUT_SIZE / max(height, width)
+    resized = cv2.resize(face, (max(1, int(width * factor)), max(1, int(height * factor))))
+    pad_y = EMOTION_INPUT_SIZE - resized.shape[0]
+    pad_x = EMOTION_INPUT_SIZE - resized.shape[1]
+    return np.pad(resized, ((pad_y // 2, pad_y - pad_y // 2), (pad_x // 2, pad_x - pad_x // 2)), "constant")
+
+def classify_emotions(faces):
+    """
+    Classify a list of face crops in a single forward pass.
+    Args:
+        faces: RGB face crops with values in [0, 1], as returned by DeepFace.extract_faces.
+    Returns:
+        A (len(faces), 7) array of emotion percentages in EMOTION_LABELS order.
+    """
+    if not faces:
+        return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+    batch = np.stack([to_model_input(face) for face in faces])[..., np.newaxis]
+    predictions = np.asarray(emotion_backends.get_backend().predict(batch), dtype=np.float32)
+    totals = predictions.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1
+    return 100 * predictions / totals
+
+def analyze_faces(image, detector=DETECTOR_BACKEND):
+    """
+    Detect every face in an image and classify all of them in one batch.
+    Returns a list of face dicts in DeepFace's analysis format (region, emotion, dominant_emotion, face_confidence).
+    """
+    extracted = detect_faces(image, detector=detector)
+    scores = classify_emotions([item["face"] for item in extracted])
+    results = []
+    for item, row in zip(extracted, scores):
+        emotion = {label: float(score) for label, score in zip(EMOTION_LABELS, row)}
+        results.append({
+            "region": jsonable(item["facial_area"]),
+            "face_confidence": float(item.get("confidence", 0)),
+            "emotion": emotion,
+            "dominant_emotion": EMOTION_LABELS[int(np.argmax(row))],
+        })
+    return results
+
+def tile_faces(face_crop, count, tile_size=160):
+    """Build a synthetic group photo by tiling the same face `count` times on a grid."""
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / columns))
+    canvas = np.full((rows * tile_size, columns * tile_size, 3), 255, dtype=np.uint8)
+    tile = cv2.resize(face_crop, (tile_size - 20, tile_size - 20))
+    for position in range(count):
+        row, column = divmod(position, columns)
+        y, x = row * tile_size + 10, column * tile_size + 10
+        canvas[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+    return canvas
+
+def benchmark(image_path, face_counts=(1, 2, 5, 10, 20, 50), repeats=3):
+    """Report faces per second for the batched pipeline against one classification call per face."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Error loading image {image_path}.")
+    region = max(detect_faces(image), key=lambda item: item.get("confidence", 0))["facial_area"]
+    x, y, w, h = region["x"], region["y"], region["w"], region["h"]
+    # Keep some margin around the face so the detector still finds it once tiled
+    margin = int(0.3 * max(w, h))
+    face_crop = image[max(0, y - margin):y + h + margin, max(0, x - margin):x + w + margin]
+    classify_emotions([np.zeros((EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE, 3), dtype=np.float32)])  # Warm up
+
+    report = []
+    for count in face_counts:
+        group = tile_faces(face_crop, count)
+        faces = [item["face"] for item in detect_faces(group)]
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            classify_emotions(faces)
+        batched = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for face in faces:
+                classify_emotions([face])
+        sequential = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            analyze_faces(group)
+        end_to_end = (time.perf_counter() - start) / repeats
+
+        row = {
+            "faces_requested": count,
+            "faces_detected": len(faces),
+            "batched_faces_per_second": len(faces) / batched if batched else 0.0,
+            "sequential_faces_per_second": len(faces) / sequential if sequential else 0.0,
+            "end_to_end_faces_per_second": len(faces) / end_to_end if end_to_end else 0.0,
+        }
+        print(json.dumps(row))
+        report.append(row)
+    return report
+
+def check_hit_rate(folder_path, detection_sizes=DETECTION_SIZES, min_iou=0.5):
+    """
+    Compare the downscaled detection pyramid with full-resolution detection on every image in a folder:
+    the faces it still finds, and its cost on all images and on the images without any face, where
+    every level runs.
+    """
+    from face_tracking import region_iou
+
+    totals = {"images": 0, "reference_faces": 0, "matched_faces": 0, "extra_faces": 0,
+              "reference_seconds": 0.0, "pyramid_seconds": 0.0,
+              "no_face_images": 0, "no_face_reference_seconds": 0.0, "no_face_pyramid_seconds": 0.0}
+    for name in sorted(os.listdir(folder_path)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            continue
+        image = cv2.imread(os.path.join(folder_path, name))
+        if image is None:
+            continue
+
+        start = time.perf_counter()
+        reference = [item["facial_area"] for item in detect_faces(image, (None,)) if item["confidence"] > 0]
+        middle = time.perf_counter()
+        candidates = [item["facial_area"] for item in detect_faces(image, detection_sizes) if item["confidence"] > 0]
+        end = time.perf_counter()
+
+        matched = sum(1 for region in reference
+                      if any(region_iou(region, candidate) >= min_iou for candidate in candidates))
+        totals["images"] += 1
+        totals["reference_faces"] += len(reference)
+        totals["matched_faces"] += matched
+        totals["extra_faces"] += max(0, len(candidates) - matched)
+        totals["reference_seconds"] += middle - start
+        totals["pyramid_seconds"] += end - middle
+        if not reference and not candidates:
+            totals["no_face_images"] += 1
+            totals["no_face_reference_seconds"] += middle - start
+            totals["no_face_pyramid_seconds"] += end - middle
+        print(json.dumps({"image": name, "reference_faces": len(reference), "pyramid_faces": len(candidates),
+                          "matched": matched, "reference_ms": 1000 * (middle - start),
+                          "pyramid_ms": 1000 * (end - middle)}))
+
+    totals["hit_rate"] = totals["matched_faces"] / totals["reference_faces"] if totals["reference_faces"] else 1.0
+    if totals["no_face_images"]:
+        # Above 1.0 the pyramid is slower than one full-resolution pass when there is nothing to find
+        totals["no_face_cost_ratio"] = totals["no_face_pyramid_seconds"] / totals["no_face_reference_seconds"]
+    print(json.dumps(totals))
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched multi-face emotion analysis.")
+    parser.add_argument("image", nargs="?", default=os.path.join("dataset", "girl-1894125_1280.jpg"),
+                        help="image with at least one face, tiled to build the group photos")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--hit-rate", metavar="DIR",
+                        help="instead of the throughput benchmark, compare pyramid and full-resolution detection on DIR")
+    parser.add_argument("--detection-sizes", type=parse_detection_sizes,
+                        help="pyramid levels to compare, e.g. 640 or 640,1280,full (default: EMOTION_DETECTION_SIZES)")
+    args = parser.parse_args()
+
+    detection_sizes = args.detection_sizes or DETECTION_SIZES
+    if args.hit_rate:
+        check_hit_rate(args.hit_rate, detection_sizes)
+    else:
+        benchmark(args.image, repeats=args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+
+DETECT_EVERY_N_FRAMES = 10
+EMA_ALPHA = 0.35
+MIN_TRACK_CONFIDENCE = 0.5
+IOU_MATCH_THRESHOLD = 0.3
+MAX_MISSED_DETECTIONS = 2
+
+def region_iou(a, b):
+    """Intersection over union of two {'x', 'y', 'w', 'h'} regions."""
+    left, top = max(a['x'], b['x']), max(a['y'], b['y'])
+    right = min(a['x'] + a['w'], b['x'] + b['w'])
+    bottom = min(a['y'] + a['h'], b['y'] + b['h'])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = a['w'] * a['h'] + b['w'] * b['h'] - intersection
+    return intersection / union if union > 0 else 0.0
+
+class Track:
+    """One face followed across frames, with exponentially smoothed emotion scores."""
+
+    def __init__(self, track_id, face):
+        self.id = track_id
+        self.region = {key: int(face['region'][key]) for key in ('x', 'y', 'w', 'h')}
+        self.emotion = dict(face.get('emotion', {}))
+        self.points = None
+        self.seeded_points = 0
+        self.confidence = 1.0
+        self.missed = 0
+
+    def smooth(self, face, alpha):
+        self.region = {key: int(face['region'][key]) for key in ('x', 'y', 'w', 'h')}
+        for emotion, score in face.get('emotion', {}).items():
+            previous = self.emotion.get(emotion, score)
+            self.emotion[emotion] = alpha * score + (1 - alpha) * previous
+        self.confidence = 1.0
+        self.missed = 0
+
+    def as_face(self):
+        """Return the track in DeepFace's analysis format, as used by draw_face_box_and_emotions."""
+        dominant = max(self.emotion, key=self.emotion.get) if self.emotion else 'unknown'
+        return {'region': dict(self.region), 'emotion': dict(self.emotion), 'dominant_emotion': dominant}
+
+class FaceTracker:
+    """
+    Keeps faces between detections so the emotion model only runs every few frames.
+    Face boxes are moved with sparse optical flow; detections are matched to tracks by IoU
+    and their emotion scores are smoothed with an exponential moving average.
+    Args:
+        detect_every: Run a detection at least every this many frames.
+        alpha: EMA weight of a new emotion score (1.0 disables smoothing).
+        min_confidence: Request a detection as soon as a track keeps fewer of its flow points.
+    """
+
+    def __init__(self, detect_every=DETECT_EVERY_N_FRAMES, alpha=EMA_ALPHA, min_confidence=MIN_TRACK_CONFIDENCE):
+        self.detect_every = detect_every
+        self.alpha = alpha
+        self.min_confidence = min_confidence
+        self.tracks = []
+        self.next_id = 0
+        self.previous_gray = None
+        self.frames_since_detection = detect_every  # Detect on the first frame
+        self.detection_pending = False
+
+    def needs_detection(self):
+        if self.frames_since_detection >= self.detect_every:
+            return True
+        # Low confidence asks for a detection once; while it is running, only the periodic request repeats it
+        if self.detection_pending:
+            return False
+        return any(track.confidence < self.min_confidence for track in self.tracks)
+
+    def mark_detection_requested(self):
+        self.frames_since_detection = 0
+        self.detection_pending = True
+
+    def update_detections(self, faces, frame, current_frame=None):
+        """
+        Merge a fresh analysis into the tracks and re-seed optical flow on `frame`, the frame the analysis
+        ran on. Detections arrive one inference later, so with `current_frame` the tracks are then moved
+        forward to it instead of being left at the positions the faces had in the older frame.
+        """
+        self.detection_pending = False
+        # DeepFace reports the whole frame with zero confidence when enforce_detection=False finds nobody
+        faces = [face for face in faces if face.get('region') and face.get('face_confidence', 1) > 0]
+        pairs = sorted(((region_iou(track.region, face['region']), t, f)
+                        for t, track in enumerate(self.tracks) for f, face in enumerate(faces)), reverse=True)
+        matched_tracks, matched_faces = set(), set()
+        for iou, t, f in pairs:
+            if iou < IOU_MATCH_THRESHOLD:
+                break
+            if t in matched_tracks or f in matched_faces:
+                continue
+            self.tracks[t].smooth(faces[f], self.alpha)
+            matched_tracks.add(t)
+            matched_faces.add(f)
+
+        kept = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+            if track.missed <= MAX_MISSED_DETECTIONS:
+                kept.append(track)
+        for f, face in enumerate(faces):
+            if f not in matched_faces:
+                kept.append(Track(self.next_id, face))
+                self.next_id += 1
+        self.tracks = kept
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for track in self.tracks:
+            track.points = self.seed_points(gray, track.region)
+            track.seeded_points = 0 if track.points is None else len(track.points)
+        self.previous_gray = gray
+        if current_frame is not None:
+            self.propagate(current_frame)
+
+    def seed_points(self, gray, region):
+        mask = np.zeros_like(gray)
+        x, y, w, h = region['x'], region['y'], region['w'], region['h']
+        mask[max(y, 0):y + h, max(x, 0):x + w] = 255
+        return cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01, minDistance=5, mask=mask)
+
+    def propagate(self, frame):
+        """Move every track to its position in `frame` using Lucas-Kanade optical flow."""
+        self.frames_since_detection += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.previous_gray is None or self.previous_gray.shape != gray.shape:
+            self.previous_gray = gray
+            return
+
+        for track in self.tracks:
+            if track.points is None or len(track.points) == 0:
+                track.confidence = 0.0
+                continue
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, track.points, None,
+                                                             winSize=(15, 15), maxLevel=2)
+            good = status.reshape(-1) == 1
+            # Share of the points seeded at the last detection that are still followed
+            track.confidence = float(good.sum()) / track.seeded_points
+            if not good.any():
+                track.points = None
+                continue
+            shift = np.median(new_points[good] - track.points[good], axis=0).reshape(-1)
+            track.region['x'] = int(round(track.region['x'] + shift[0]))
+            track.region['y'] = int(round(track.region['y'] + shift[1]))
+            track.points = new_points[good].reshape(-1, 1, 2)
+        self.previous_gray = gray
+
+    def faces(self):
+        return [track.as_face() for track in self.tracks]
@@ -0,0 +1,133 @@
+import os
+import time
+import sqlite3
+import threading
+
+from result_cache import content_hash
+
+MANIFEST_PATH = os.path.join("cache", "manifest.sqlite")
+# Files modified more recently than this may still be being copied in; they are picked up on a later scan
+SETTLE_SECONDS = 2.0
+
+class Manifest:
+    """
+    What has already been analyzed in a folder: path, size, mtime and content hash of every processed file.
+    A file is processed again only when its size or mtime changed and its content hash differs, so
+    touched or re-copied files are skipped. Files are marked one by one as their results arrive, so an
+    interrupted run resumes with whatever was not marked yet.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                output TEXT,
+                updated REAL NOT NULL
+            )""")
+        self.connection.commit()
+
+    def known(self, folder_path):
+        """Manifest entries under a folder, keyed by absolute path."""
+        prefix = os.path.join(os.path.abspath(folder_path), "")
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, size, mtime, hash FROM files WHERE path >= ? AND path < ?",
+                (prefix, prefix + "\uffff")).fetchall()
+        return {path: (size, mtime, digest) for path, size, mtime, digest in rows}
+
+    def pending(self, folder_path, image_paths, settle_seconds=SETTLE_SECONDS):
+        """Return the images that are new or whose content changed since they were last processed."""
+        known = self.known(folder_path)
+        now = time.time()
+        pending = []
+        for image_path in image_paths:
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue  # Removed while scanning
+            if now - stat.st_mtime < settle_seconds:
+                continue
+            entry = known.get(os.path.abspath(image_path))
+            if entry is None:
+                pending.append(image_path)
+                continue
+            size, mtime, digest = entry
+            if size == stat.st_size and mtime == stat.st_mtime:
+                continue
+            if content_hash(image_path) == digest:
+                self.update_stat(image_path, stat)  # Touched or copied again, content unchanged
+                continue
+            pending.append(image_path)
+        return pending
+
+    def update_stat(self, image_path, stat):
+        with self.lock:
+            self.connection.execute("UPDATE files SET size = ?, mtime = ?, updated = ? WHERE path = ?",
+                                    (stat.st_size, stat.st_mtime, time.time(), os.path.abspath(image_path)))
+            self.connection.commit()
+
+    def mark(self, image_path, status, output=None):
+        """Record a processed file ('done' or 'failed'); failed files are retried only once they change."""
+        try:
+            stat = os.stat(image_path)
+            digest = content_hash(image_path)
+        except OSError:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, hash, status, output, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(image_path), stat.st_size, stat.st_mtime, digest, status, output, time.time()))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def watch_folder(folder_path, manifest, list_images, poll_interval=2.0, settle_seconds=SETTLE_SECONDS):
+    """
+    Yield lists of new or changed images as they land in a folder, forever.
+    Uses inotify (through the watchdog package) to wake up as soon as something changes when it is
+    installed, and falls back to rescanning every `poll_interval` seconds otherwise.
+    """
+    changed = threading.Event()
+    observer = None
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                changed.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), folder_path, recursive=False)
+        observer.start()
+        print(f"Watching {folder_path} for new images...")
+    except ImportError:
+        print(f"Polling {folder_path} for new images every {poll_interval:g}s (install watchdog to react immediately)...")
+    try:
+        while True:
+            # Still wake up periodically: files that were settling are only picked up on a later scan
+            if changed.wait(poll_interval):
+                # A file that just changed is still settling; rescan as soon as it is old enough to be picked up
+                time.sleep(min(poll_interval, settle_seconds) + 0.1)
+            changed.clear()
+            images = manifest.pending(folder_path, list_images(folder_path), settle_seconds)
+            if images:
+                yield images
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
@@ -0,0 +1,266 @@
+import os
+import json
+import sys
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import argparse
+import socketserver
+import numpy as np
+
+import face_pipeline
+import detector_selection
+from detector_selection import BATCH, LIVE
+
+SOCKET_PATH = os.environ.get("EMOTION_INFERENCE_SOCKET", os.path.join(tempfile.gettempdir(), "emotion_inference.sock"))
+LENGTH = struct.Struct("!I")
+
+_client = None
+_client_lock = threading.Lock()
+# TensorFlow models are not safe to call from several threads at once
+_inference_lock = threading.Lock()
+
+def unix_sockets_supported():
+    return hasattr(socket, "AF_UNIX")
+
+def analyze_local(image, profile=BATCH):
+    """
+    Analyze an image path or BGR array in this process; always returns a list of faces.
+    `profile` (LIVE or BATCH) picks the face detector through detector_selection.
+    Calls from several threads run one at a time.
+    """
+    detector = detector_selection.detector_for(profile)
+    with _inference_lock:
+        return face_pipeline.analyze_faces(image, detector=detector)
+
+def warm_up(profiles=(BATCH, LIVE)):
+    """Load the emotion model and the given profiles' detectors by analyzing a blank frame."""
+    for profile in profiles:
+        analyze_local(np.zeros((64, 64, 3), dtype=np.uint8), profile)
+
+# --- Wire protocol: [header length][JSON header][payload length][payload] ---
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Inference connection closed.")
+        received += count
+    return buffer
+
+def send_message(sock, header, payload=b""):
+    header_bytes = json.dumps(header).encode("utf-8")
+    sock.sendall(LENGTH.pack(len(header_bytes)) + header_bytes + LENGTH.pack(len(payload)))
+    if len(payload):
+        sock.sendall(payload)
+
+def recv_message(sock):
+    header_size, = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+    header = json.loads(bytes(_recv_exact(sock, header_size)).decode("utf-8"))
+    payload_size, = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+    payload = _recv_exact(sock, payload_size) if payload_size else b""
+    return header, payload
+
+# --- Server ---
+
+class InferenceRequestHandler(socketserver.BaseRequestHandler):
+    """Serve analysis requests from one client until it disconnects."""
+
+    def handle(self):
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self.server.dispatch(header, payload)
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+# socketserver only defines UnixStreamServer where AF_UNIX exists; elsewhere the module still imports
+# and analyze() runs everything in-process
+if unix_sockets_supported():
+    class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path):
+            super().__init__(socket_path, InferenceRequestHandler)
+
+        def dispatch(self, header, payload):
+            op = header.get("op")
+            if op == "ping":
+                return {"ok": True}
+            if op == "analyze":
+                if "path" in header:
+                    image = header["path"]
+                else:
+                    image = np.frombuffer(payload, dtype=header["dtype"]).reshape(header["shape"])
+                faces = analyze_local(image, header.get("profile", BATCH))
+                return {"ok": True, "faces": faces}
+            if op == "detector":
+                return {"ok": True, "detector": detector_selection.detector_for(header.get("profile", BATCH))}
+            return {"ok": False, "error": f"Unknown operation: {op}"}
+
+def server_is_running(socket_path=SOCKET_PATH):
+    if not unix_sockets_supported() or not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1.0)
+            sock.connect(socket_path)
+            send_message(sock, {"op": "ping"})
+            header, _ = recv_message(sock)
+            return header.get("ok", False)
+    except OSError:
+        return False
+
+def serve(socket_path=SOCKET_PATH):
+    """Load the models once and answer analysis requests on a Unix socket until interrupted."""
+    if not unix_sockets_supported():
+        print("Unix sockets are not supported on this platform; the inference server is unavailable.")
+        return
+    if server_is_running(socket_path):
+        print(f"Inference server already running on {socket_path}")
+        return
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Stale socket left by a previous run
+
+    # Bind before warming up so clients queue on the socket instead of loading their own model
+    server = InferenceServer(socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        print("Loading emotion model...")
+        warm_up()
+        print(f"Inference server listening on {socket_path}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+# --- Client ---
+
+class InferenceClient:
+    """Persistent connection to the inference server."""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def analyze(self, image, profile=BATCH):
+        if isinstance(image, str):
+            header, payload = {"op": "analyze", "profile": profile, "path": os.path.abspath(image)}, b""
+        else:
+            image = np.ascontiguousarray(image)
+            header = {"op": "analyze", "profile": profile, "shape": list(image.shape), "dtype": str(image.dtype)}
+            payload = memoryview(image).cast("B")
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            try:
+                send_message(self.sock, header, payload)
+                response, _ = recv_message(self.sock)
+            except OSError:
+                self.close()
+                raise
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Inference server error."))
+        return response["faces"]
+
+    def detector(self, profile=BATCH):
+        """The detector the server uses for a profile."""
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            try:
+                send_message(self.sock, {"op": "detector", "profile": profile})
+                response, _ = recv_message(self.sock)
+            except OSError:
+                self.close()
+                raise
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Inference server error."))
+        return response["detector"]
+
+def analyze(image, profile=BATCH, client=None):
+    """
+    Analyze an image path or BGR frame, preferring the warm inference server.
+    Falls back to running DeepFace in this process when no server is reachable.
+    Live callers pass profile=LIVE to get the detector chosen for the live latency budget.
+    Threads that call this concurrently can pass their own InferenceClient; the shared one sends one request at a time.
+    Returns a list of face analysis dicts.
+    """
+    global _client
+    if unix_sockets_supported() and os.path.exists(SOCKET_PATH):
+        if client is None:
+            with _client_lock:
+                if _client is None:
+                    _client = InferenceClient()
+                client = _client
+        try:
+            return client.analyze(image, profile)
+        except (ConnectionError, OSError):
+            pass  # Server went away; fall through to in-process analysis
+    return analyze_local(image, profile)
+
+def detector_name(profile=BATCH):
+    """
+    The detector analyze() uses for a profile. In auto mode this asks the running server, which has
+    calibrated already, so the calling process only calibrates when it would analyze locally anyway.
+    """
+    detector = detector_selection.resolved(profile)
+    if detector is not None:
+        return detector
+    if server_is_running():
+        # The server may still be calibrating
+        client = InferenceClient(timeout=600.0)
+        try:
+            detector = client.detector(profile)
+            detector_selection.pin(profile, detector)
+            return detector
+        except OSError:
+            pass  # Server went away; resolve in this process
+        finally:
+            client.close()
+    return detector_selection.detector_for(profile)
+
+def prepare(profile=BATCH):
+    """Make sure analyze() will answer quickly: warms the server when one is reachable, otherwise this process."""
+    analyze(np.zeros((64, 64, 3), dtype=np.uint8), profile)
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm emotion inference server.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path to listen on")
+    args = parser.parse_args()
+    serve(args.socket)
+
+if __name__ == "__main__":
+    main()
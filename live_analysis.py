@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import deque
+
+class LatestFrameSlot:
+    """Single-slot mailbox between the capture loop and the inference worker; a newer frame replaces an unread one."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.sequence += 1
+            self.condition.notify()
+
+    def take(self, timeout=None):
+        """Wait for a frame that has not been taken yet and return it, or None on timeout."""
+        with self.condition:
+            if self.frame is None:
+                self.condition.wait(timeout)
+            frame, self.frame = self.frame, None
+            return frame
+
+class RateMeter:
+    """Events per second over a sliding time window."""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.times = deque()
+        self.lock = threading.Lock()
+
+    def tick(self):
+        now = time.perf_counter()
+        with self.lock:
+            self.times.append(now)
+            while now - self.times[0] > self.window:
+                self.times.popleft()
+
+    def rate(self):
+        with self.lock:
+            if len(self.times) < 2:
+                return 0.0
+            elapsed = self.times[-1] - self.times[0]
+            return (len(self.times) - 1) / elapsed if elapsed > 0 else 0.0
+
+class LiveAnalyzer(threading.Thread):
+    """
+    Background worker that keeps analyzing the most recent frame.
+    Args:
+        analyze: Callable turning a BGR frame into an analysis result.
+        slot: The LatestFrameSlot frames are taken from.
+    """
+
+    def __init__(self, analyze, slot):
+        super().__init__(name="live-analyzer", daemon=True)
+        self.analyze = analyze
+        self.slot = slot
+        self.meter = RateMeter()
+        self.lock = threading.Lock()
+        self.result = None
+        self.result_frame = None
+        self.result_time = None
+        self.result_count = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            frame = self.slot.take(timeout=0.2)
+            if frame is None:
+                continue
+            try:
+                result = self.analyze(frame)
+            except Exception as e:
+                print(f"Error detecting emotion: {e}")
+                continue
+            with self.lock:
+                self.result = result
+                self.result_frame = frame
+                self.result_time = time.time()
+                self.result_count += 1
+            self.meter.tick()
+
+    def latest(self):
+        """
+        Return (result count, most recent result, the frame it was computed on); the result and
+        frame are None before the first one finishes.
+        """
+        with self.lock:
+            return self.result_count, self.result, self.result_frame
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float("inf"))
+EXPORT_INTERVAL = 5.0
+
+_enabled = False
+_overlay = False
+_histograms = {}
+_registry_lock = threading.Lock()
+_exporter = None
+# Returned by span() while disabled; reusable, so the disabled path allocates nothing
+_NULL_SPAN = nullcontext()
+
+class Histogram:
+    """Latency histogram with fixed buckets, in the shape Prometheus expects."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(BUCKETS, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound if bound != float("inf") else BUCKETS[-2]
+        return BUCKETS[-2]
+
+    def snapshot(self):
+        with self.lock:
+            return {"count": self.count, "sum_seconds": self.total, "last_seconds": self.last,
+                    "mean_seconds": self.total / self.count if self.count else 0.0,
+                    "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                                for bound, count in zip(BUCKETS, self.counts)}}
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+def enabled():
+    return _enabled
+
+def overlay_enabled():
+    return _enabled and _overlay
+
+def enable(path=None, interval=EXPORT_INTERVAL, overlay=False):
+    """
+    Start collecting timings.
+    Args:
+        path: File the metrics are exported to every `interval` seconds; '.json' selects JSON,
+            anything else the Prometheus text format. None keeps them in memory only.
+        interval: Seconds between exports.
+        overlay: Whether the live window should draw the stats on the video feed.
+    """
+    global _enabled, _overlay, _exporter
+    _enabled = True
+    _overlay = overlay
+    if path and _exporter is None:
+        _exporter = Exporter(path, interval)
+        _exporter.start()
+
+def enable_from_environment():
+    """Turn metrics on when EMOTION_METRICS names an export file (EMOTION_METRICS_OVERLAY=1 adds the stats overlay)."""
+    path = os.environ.get("EMOTION_METRICS")
+    if path:
+        enable(path, float(os.environ.get("EMOTION_METRICS_INTERVAL", EXPORT_INTERVAL)),
+               overlay=os.environ.get("EMOTION_METRICS_OVERLAY") == "1")
+
+def histogram(name):
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name)
+        return _histograms[name]
+
+def observe(name, seconds):
+    if _enabled:
+        histogram(name).observe(seconds)
+
+def span(name):
+    """Time a block: `with metrics.span("camera_read"): ...`. A shared no-op while metrics are disabled."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name)
+
+def snapshot():
+    with _registry_lock:
+        histograms = list(_histograms.values())
+    return {item.name: item.snapshot() for item in histograms}
+
+def to_prometheus(data):
+    lines = []
+    for name, values in sorted(data.items()):
+        metric = f"emotion_{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in values["buckets"].items():
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum {values['sum_seconds']}")
+        lines.append(f"{metric}_count {values['count']}")
+    return "\n".join(lines) + "\n"
+
+def export(path):
+    """Write the current metrics atomically, as JSON or Prometheus text depending on the extension."""
+    data = snapshot()
+    content = json.dumps(data, indent=2) if path.endswith(".json") else to_prometheus(data)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+def format_stats():
+    """One short line per span for the on-screen stats overlay."""
+    lines = []
+    for name, values in sorted(snapshot().items()):
+        item = histogram(name)
+        lines.append(f"{name}: {values['mean_seconds'] * 1000:.1f} ms avg, "
+                     f"p90 <= {item.quantile(0.9) * 1000:.0f} ms")
+    return lines
+
+class Exporter(threading.Thread):
+    def __init__(self, path, interval):
+        super().__init__(name="metrics-exporter", daemon=True)
+        self.path = path
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                export(self.path)
+            except OSError as e:
+                print(f"Failed to export metrics: {e}")
+
+def flush():
+    """Export once more right away, e.g. before the application exits."""
+    if _exporter is not None:
+        export(_exporter.path)
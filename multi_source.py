@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import argparse
+import threading
+import cv2
+import inference_server
+import metrics
+from live_analysis import RateMeter
+
+class Source:
+    """
+    One video input (camera index, RTSP/HTTP URL or video file) and its counters.
+    Args:
+        uri: Camera index as a string of digits, or anything cv2.VideoCapture accepts.
+        name: Label used in the stats; defaults to the uri.
+        realtime: Read video files at their own frame rate, like a camera would deliver them.
+        loop: Start video files over when they end.
+    """
+
+    def __init__(self, uri, name=None, realtime=True, loop=False):
+        self.uri = int(uri) if str(uri).isdigit() else uri
+        self.name = name or str(uri)
+        self.is_file = isinstance(self.uri, str) and os.path.isfile(self.uri)
+        self.realtime = realtime
+        self.loop = loop
+        self.captured = 0
+        self.dropped = 0
+        self.analyzed = 0
+        self.errors = 0
+        self.finished = False
+        self.latency = metrics.Histogram(f"{self.name}_latency")
+        self.meter = RateMeter()
+        self.result = None
+
+    def stats(self):
+        return {"captured": self.captured, "analyzed": self.analyzed, "dropped": self.dropped, "errors": self.errors,
+                "analyzed_per_second": round(self.meter.rate(), 2),
+                "latency_mean_ms": round(self.latency.snapshot()["mean_seconds"] * 1000, 1),
+                "latency_p90_ms": round(self.latency.quantile(0.9) * 1000, 1)}
+
+class FairScheduler:
+    """
+    Hands frames from many sources to a shared pool of inference workers.
+    Each source keeps at most one pending frame (a newer capture replaces it and counts as a drop) and
+    at most one frame in flight, and sources are served round-robin, so a fast or busy stream can
+    never push out the others: every source gets a turn before any source gets a second one.
+    """
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.condition = threading.Condition()
+        self.pending = {}  # source -> (frame, capture time)
+        self.in_flight = set()
+        self.next_index = 0
+        self.closed = False
+
+    def put(self, source, frame, captured_at):
+        with self.condition:
+            if source in self.pending:
+                source.dropped += 1
+            self.pending[source] = (frame, captured_at)
+            self.condition.notify()
+
+    def take(self, timeout=None):
+        """Wait for the next source in round-robin order with a frame ready; returns (source, frame, capture time) or None."""
+        with self.condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self.closed:
+                for offset in range(len(self.sources)):
+                    source = self.sources[(self.next_index + offset) % len(self.sources)]
+                    if source in self.pending and source not in self.in_flight:
+                        self.next_index = (self.next_index + offset + 1) % len(self.sources)
+                        self.in_flight.add(source)
+                        frame, captured_at = self.pending.pop(source)
+                        return source, frame, captured_at
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return None
+
+    def done(self, source):
+        with self.condition:
+            self.in_flight.discard(source)
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class CaptureWorker(threading.Thread):
+    """Reads one source as fast as it delivers frames and offers every frame to the scheduler."""
+
+    def __init__(self, source, scheduler):
+        super().__init__(name=f"capture-{source.name}", daemon=True)
+        self.source = source
+        self.scheduler = scheduler
+        self.running = True
+
+    def run(self):
+        source = self.source
+        cap = cv2.VideoCapture(source.uri)
+        if not cap.isOpened():
+            print(f"Could not open source {source.name}")
+            source.finished = True
+            return
+        frame_interval = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30.0) if source.is_file and source.realtime else 0
+        next_frame = time.perf_counter()
+        try:
+            while self.running:
+                ret, frame = cap.read()
+                if not ret:
+                    if source.is_file and source.loop and source.captured:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                source.captured += 1
+                self.scheduler.put(source, frame, time.perf_counter())
+                if frame_interval:
+                    next_frame += frame_interval
+                    delay = next_frame - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            cap.release()
+            source.finished = True
+
+    def stop(self):
+        self.running = False
+
+class InferenceWorker(threading.Thread):
+    """
+    Takes frames from the scheduler and analyzes them. Without a custom analyze function each worker
+    talks to the inference server over its own connection, so frames are transferred and decoded in
+    parallel; the model itself runs one frame at a time, on the server or in this process.
+    """
+
+    def __init__(self, scheduler, analyze, index, on_result=None):
+        super().__init__(name=f"inference-{index}", daemon=True)
+        self.scheduler = scheduler
+        self.client = None
+        if analyze is None:
+            self.client = inference_server.InferenceClient()
+            analyze = lambda frame: analyze_live(frame, self.client)
+        self.analyze = analyze
+        self.on_result = on_result
+        self.running = True
+
+    def run(self):
+        while self.running:
+            item = self.scheduler.take(timeout=0.2)
+            if item is None:
+                continue
+            source, frame, captured_at = item
+            try:
+                faces = self.analyze(frame)
+                source.result = faces
+                source.analyzed += 1
+                source.latency.observe(time.perf_counter() - captured_at)
+                source.meter.tick()
+                if self.on_result is not None:
+                    self.on_result(source, faces)
+            except Exception as e:
+                source.errors += 1
+                print(f"Error analyzing {source.name}: {e}")
+            finally:
+                self.scheduler.done(source)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+def analyze_live(frame, client=None):
+    """Streams share the live latency budget, so they use the live profile's detector."""
+    return inference_server.analyze(frame, inference_server.LIVE, client)
+
+def run_sources(sources, workers=2, duration=None, analyze=None, output_path=None, report_every=5.0):
+    """
+    Ingest several sources at once through one shared, bounded inference pool.
+    Args:
+        sources: The Source objects to read.
+        workers: Number of inference threads shared by all sources.
+        duration: Stop after this many seconds; by default run until every source has ended (Ctrl+C to stop cameras).
+        analyze: The analysis function; by default each worker uses its own inference server connection
+            with in-process fallback and the live profile.
+        output_path: Optional JSONL file receiving one record per analyzed frame.
+        report_every: Seconds between the per-source stats printouts.
+    Returns:
+        The final per-source stats.
+    """
+    scheduler = FairScheduler(sources)
+    output_file = open(output_path, "a", encoding="utf-8") if output_path else None
+    output_lock = threading.Lock()
+
+    def write_result(source, faces):
+        with output_lock:
+            output_file.write(json.dumps({"source": source.name, "time": time.time(), "faces": faces}) + "\n")
+
+    captures = [CaptureWorker(source, scheduler) for source in sources]
+    pool = [InferenceWorker(scheduler, analyze, index, write_result if output_file else None) for index in range(max(1, workers))]
+    for thread in captures + pool:
+        thread.start()
+
+    start = time.perf_counter()
+    last_report = start
+    try:
+        while True:
+            time.sleep(0.2)
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            with scheduler.condition:
+                idle = not scheduler.pending and not scheduler.in_flight
+            if idle and all(source.finished for source in sources):
+                break
+            if now - last_report >= report_every:
+                last_report = now
+                for source in sources:
+                    print(f"{source.name}: {json.dumps(source.stats())}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for thread in captures + pool:
+            thread.stop()
+        scheduler.close()
+        for thread in captures + pool:
+            thread.join(timeout=2)
+        for worker in pool:
+            worker.close()
+        if output_file is not None:
+            output_file.close()
+
+    return {source.name: source.stats() for source in sources}
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze several cameras, streams or video files at once.")
+    parser.add_argument("sources", nargs="+", help="camera indexes, RTSP/HTTP URLs or video files")
+    parser.add_argument("--workers", type=int, default=2, help="inference threads shared by all sources; they overlap frame transfer, the model runs one frame at a time")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--loop", action="store_true", help="restart video files when they end")
+    parser.add_argument("--fast", action="store_true", help="read video files as fast as possible instead of at their frame rate")
+    parser.add_argument("--output", help="append one JSON record per analyzed frame to this file")
+    args = parser.parse_args()
+
+    metrics.enable_from_environment()
+    sources = []
+    for uri in args.sources:
+        # The same file may be given twice to simulate two cameras; keep their stats apart
+        count = sum(1 for source in sources if str(source.uri) == uri)
+        sources.append(Source(uri, name=f"{uri}#{count + 1}" if count else None, realtime=not args.fast, loop=args.loop))
+    stats = run_sources(sources, workers=args.workers, duration=args.duration, output_path=args.output)
+    print(json.dumps(stats, indent=2))
+    metrics.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import time
+import json
+import argparse
+import cv2
+import numpy as np
+
+from text_sprites import blit
+
+class Overlay:
+    """
+    Collects the boxes and labels for one frame and draws them in a single pass.
+    Semi-transparent rectangles are blended only inside their own bounds instead of copying and
+    blending the whole frame per element; elements are drawn in the order they were added, so the
+    result matches drawing them one by one.
+    """
+
+    def __init__(self):
+        self.operations = []
+
+    def rectangle(self, corner, opposite_corner, color, alpha=1.0, thickness=-1):
+        """Queue a rectangle; `alpha` < 1 blends a filled rectangle with what is underneath."""
+        self.operations.append(("rectangle", corner, opposite_corner, color, alpha, thickness))
+
+    def text(self, text, origin, font_scale, color, thickness=1, line_type=cv2.LINE_8):
+        self.operations.append(("text", text, origin, font_scale, color, thickness, line_type))
+
+    def sprite(self, sprite, position):
+        """Queue a pre-rendered text sprite (see text_sprites) anchored at a text position."""
+        self.operations.append(("sprite", sprite, position))
+
+    def render(self, image):
+        for operation in self.operations:
+            if operation[0] == "rectangle":
+                _, corner, opposite_corner, color, alpha, thickness = operation
+                if alpha < 1.0 and thickness < 0:
+                    blend_rectangle(image, corner, opposite_corner, color, alpha)
+                else:
+                    cv2.rectangle(image, corner, opposite_corner, color, thickness)
+            elif operation[0] == "sprite":
+                _, sprite, position = operation
+                blit(image, sprite, position)
+            else:
+                _, text, origin, font_scale, color, thickness, line_type = operation
+                cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness, line_type)
+        self.operations.clear()
+        return image
+
+def blend_rectangle(image, corner, opposite_corner, color, alpha):
+    """Alpha-blend a filled rectangle into the image, touching only the pixels it covers."""
+    height, width = image.shape[:2]
+    # cv2.rectangle includes both corners; clip to the image like it does
+    x0, x1 = sorted((corner[0], opposite_corner[0]))
+    y0, y1 = sorted((corner[1], opposite_corner[1]))
+    x0, y0 = max(x0, 0), max(y0, 0)
+    x1, y1 = min(x1 + 1, width), min(y1 + 1, height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    roi = image[y0:y1, x0:x1]
+    fill = np.empty_like(roi)
+    fill[:] = color
+    cv2.addWeighted(fill, alpha, roi, 1 - alpha, 0, roi)
+
+# --- Benchmark against the previous full-frame copy-and-blend drawing ---
+
+def draw_with_full_frame_blends(image, analysis):
+    """The previous photos.py drawing code: one full image copy and blend per box and per label."""
+    def draw_label(text, position, color, bg_color):
+        font_scale, thickness = 0.6, 1
+        max_width = int(image.shape[1] * 0.8)
+        x, y = position
+        while True:
+            (text_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+            if text_width <= max_width or font_scale <= 0.3:
+                break
+            font_scale -= 0.1
+        copy = image.copy()
+        cv2.rectangle(copy, (x - 5, y - text_height - 10), (x + text_width + 5, y + 5), bg_color, -1)
+        cv2.addWeighted(copy, 0.6, image, 0.4, 0, image)
+        cv2.putText(image, text, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+
+    for face in analysis:
+        region = face['region']
+        x, y, w, h = region['x'], region['y'], region['w'], region['h']
+        copy = image.copy()
+        cv2.rectangle(copy, (x, y), (x + w, y + h), (0, 255, 0), -1)
+        cv2.addWeighted(copy, 0.3, image, 0.7, 0, image)
+        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        emotions = face['emotion']
+        stress_grade = min(max(sum(emotions.get(e, 0) for e in ["angry", "disgust", "fear", "sad"]), 0), 100)
+        draw_label(f"Dominant: {face['dominant_emotion']}", (x, y - 30), (0, 255, 0), (0, 0, 0))
+        y_offset = y + h + 20
+        for emotion, score in sorted(emotions.items(), key=lambda item: item[1], reverse=True):
+            draw_label(f"{emotion.capitalize()}: {score:.1f}%", (x, y_offset), (255, 255, 255), (50, 50, 50))
+            y_offset += int(25 * 0.6)
+        draw_label(f"Stress Grade: {stress_grade:.1f}%", (x, y_offset), (255, 165, 0), (50, 50, 50))
+
+def synthetic_analysis(width, height, face_count, seed=0):
+    """Fixed pseudo-random face regions and emotion scores for rendering benchmarks."""
+    random = np.random.default_rng(seed)
+    labels = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+    faces = []
+    for _ in range(face_count):
+        size = int(random.integers(60, max(61, min(width, height) // 4)))
+        x = int(random.integers(0, max(1, width - size)))
+        y = int(random.integers(40, max(41, height - size - 150)))
+        scores = random.dirichlet(np.ones(len(labels))) * 100
+        emotion = {label: float(score) for label, score in zip(labels, scores)}
+        faces.append({"region": {"x": x, "y": y, "w": size, "h": size}, "emotion": emotion,
+                      "dominant_emotion": max(emotion, key=emotion.get)})
+    return faces
+
+def benchmark(sizes=((1280, 720), (1280, 853)), face_counts=(1, 2, 5, 10, 20), repeats=20):
+    """Time photos.draw_face_box_and_emotions against the previous full-frame implementation."""
+    import photos
+
+    report = []
+    for width, height in sizes:
+        base = np.random.default_rng(1).integers(0, 256, (height, width, 3), dtype=np.uint8)
+        for face_count in face_counts:
+            analysis = synthetic_analysis(width, height, face_count)
+            timings = {}
+            outputs = {}
+            for name, draw in (("full_frame", draw_with_full_frame_blends),
+                               ("single_pass", photos.draw_face_box_and_emotions)):
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    image = base.copy()
+                    draw(image, analysis)
+                timings[name] = 1000 * (time.perf_counter() - start) / repeats
+                outputs[name] = image
+            row = {"width": width, "height": height, "faces": face_count,
+                   "full_frame_ms": timings["full_frame"], "single_pass_ms": timings["single_pass"],
+                   "speedup": timings["full_frame"] / timings["single_pass"] if timings["single_pass"] else 0.0,
+                   "identical": bool(np.array_equal(outputs["full_frame"], outputs["single_pass"]))}
+            print(json.dumps(row))
+            report.append(row)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the single-pass overlay renderer.")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(repeats=args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,22 @@
 import cv2
-from deepface import DeepFace
 from tkinter import Tk, filedialog, messagebox, Button, Toplevel, Label, Frame, Canvas
 from PIL import Image, ImageTk
 import os
+import json
+import queue
+import itertools
+import argparse
+import multiprocessing
 from datetime import datetime
+import inference_server
+import detector_selection
+import result_cache
+import results_store
+import metrics
+from prefetch import Prefetcher
+from overlay import Overlay
+from capture_writer import CaptureWriter
+from folder_manifest import Manifest, watch_folder
 
 # Ensure the "photos_captures" directory exists
 captures_dir = "photos_captures"
@@ -12,7 +25,15 @@ os.makedirs(captures_dir, exist_ok=True)
 # Suppress TensorFlow logging messages
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
-def draw_text_with_background(image, text, position, font_scale=0.6, color=(255, 255, 255), thickness=1, bg_color=(0, 0, 0), max_width_ratio=0.8):
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Memory ceiling: a quarter goes to the navigator's prefetched images; batch runs size their worker pool to it
+MEMORY_LIMIT_MB = int(os.environ.get("EMOTION_MEMORY_LIMIT_MB", "1024"))
+# What one batch worker needs: the emotion and detector models plus one full-resolution photo being analyzed and drawn
+WORKER_MEMORY_MB = int(os.environ.get("EMOTION_WORKER_MEMORY_MB", "512"))
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+capture_writer = None
+
+def draw_text_with_background(image, text, position, font_scale=0.6, color=(255, 255, 255), thickness=1, bg_color=(0, 0, 0), max_width_ratio=0.8, overlay=None):
     """
     Draw text with a semi-transparent background, adjusting to fit the available space.
     Args:
@@ -24,6 +45,7 @@ def draw_text_with_background(image, text, position, font_scale=0.6, color=(255,
         thickness: The thickness of the text stroke.
         bg_color: The background color behind the text.
         max_width_ratio: The maximum width of the text relative to the image's width.
+        overlay: An Overlay to queue the label on; when omitted the label is drawn right away.
     """
     font = cv2.FONT_HERSHEY_SIMPLEX
     image_height, image_width = image.shape[:2]
@@ -42,27 +64,27 @@ def draw_text_with_background(image, text, position, font_scale=0.6, color=(255,
     bg_top_left = (x - text_bg_padding, y - text_height - text_bg_padding * 2)
     bg_bottom_right = (x + text_width + text_bg_padding, y + text_bg_padding)
 
-    overlay = image.copy()
-    cv2.rectangle(overlay, bg_top_left, bg_bottom_right, bg_color, -1)
+    target = overlay if overlay is not None else Overlay()
     alpha = 0.6  # Transparency level for the background
-    cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0, image)
+    target.rectangle(bg_top_left, bg_bottom_right, bg_color, alpha=alpha)
 
     # Draw the text
-    cv2.putText(image, text, (x, y - text_bg_padding), font, font_scale, color, thickness)
+    target.text(text, (x, y - text_bg_padding), font_scale, color, thickness)
+    if overlay is None:
+        target.render(image)
 
 def draw_face_box_and_emotions(image, analysis):
     """Draw bounding boxes, display emotions, and stress grade on the image."""
+    overlay = Overlay()
     for face in analysis:
         region = face.get('region', None)
         if region:
             x, y, w, h = region['x'], region['y'], region['w'], region['h']
 
             # Draw bounding box with semi-transparent overlay
-            overlay = image.copy()
-            cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), -1)
             alpha = 0.3
-            cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0, image)
-            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            overlay.rectangle((x, y), (x + w, y + h), (0, 255, 0), alpha=alpha)
+            overlay.rectangle((x, y), (x + w, y + h), (0, 255, 0), thickness=2)
 
             # Fixed font scale to ensure all text fits
             font_scale = 0.6
@@ -74,24 +96,25 @@ def draw_face_box_and_emotions(image, analysis):
             sorted_emotions = sorted(emotions.items(), key=lambda x: x[1], reverse=True)
 
             # Calculate stress grade (sum of negative emotions)
-            negative_emotions = ["angry", "disgust", "fear", "sad"]
-            stress_grade = sum(emotions.get(emotion, 0) for emotion in negative_emotions)
-            stress_grade = min(max(stress_grade, 0), 100)  # Clamp between 0 and 100
+            stress_grade = results_store.stress_grade(emotions)
 
             # Draw dominant emotion
             draw_text_with_background(image, f"Dominant: {dominant_emotion}", (x, y - 30),
-                                      font_scale=font_scale, color=(0, 255, 0), bg_color=(0, 0, 0), thickness=thickness)
+                                      font_scale=font_scale, color=(0, 255, 0), bg_color=(0, 0, 0), thickness=thickness, overlay=overlay)
 
             # Draw each emotion percentage
             y_offset = y + h + 20
             for emotion, score in sorted_emotions:
                 draw_text_with_background(image, f"{emotion.capitalize()}: {score:.1f}%", (x, y_offset),
-                                          font_scale=font_scale, color=(255, 255, 255), bg_color=(50, 50, 50), thickness=thickness)
+                                          font_scale=font_scale, color=(255, 255, 255), bg_color=(50, 50, 50), thickness=thickness, overlay=overlay)
                 y_offset += int(25 * font_scale)
 
             # Draw stress grade
             draw_text_with_background(image, f"Stress Grade: {stress_grade:.1f}%", (x, y_offset),
-                                      font_scale=font_scale, color=(255, 165, 0), bg_color=(50, 50, 50), thickness=thickness)
+                                      font_scale=font_scale, color=(255, 165, 0), bg_color=(50, 50, 50), thickness=thickness, overlay=overlay)
+
+    # Blend every box and label in one pass over the affected regions
+    overlay.render(image)
 
 def resize_image_for_display(image, max_width=1200, max_height=900):
     """Resize image to fit within a screen size while maintaining aspect ratio."""
@@ -102,29 +125,74 @@ def resize_image_for_display(image, max_width=1200, max_height=900):
     resized_image = cv2.resize(image, (new_width, new_height))
     return resized_image
 
-def save_image(image, original_path):
-    """Save the processed image to the photos_captures directory."""
+def get_capture_writer():
+    """The process-wide background writer for processed images, created on first use."""
+    global capture_writer
+    if capture_writer is None:
+        capture_writer = CaptureWriter.from_environment()
+    return capture_writer
+
+def read_for_display(image_path, max_width=1200, max_height=900):
+    """
+    Decode an image at the smallest resolution that still fills the display size.
+    The dimensions come from the file header, and JPEGs are then decoded directly at 1/2, 1/4 or 1/8 scale
+    (IMREAD_REDUCED_COLOR_*), so a 6000px photo never exists in memory at full size.
+    Returns the image and the factor it was reduced by.
+    """
+    with Image.open(image_path) as header:
+        width, height = header.size
+    # EXIF orientation may swap the sides; size for whichever needs more pixels
+    scale = max(min(max_width / width, max_height / height), min(max_width / height, max_height / width))
+    for factor, flag in REDUCED_READ_FLAGS:
+        if factor * scale <= 1:
+            image = cv2.imread(image_path, flag)
+            if image is not None:
+                return image, factor
+    return cv2.imread(image_path), 1
+
+def scale_analysis(analysis, factor):
+    """Copy of an analysis with its face regions divided by a reduction factor."""
+    scaled = []
+    for face in analysis:
+        face = dict(face)
+        if face.get('region'):
+            face['region'] = {key: int(value / factor) if key in ('x', 'y', 'w', 'h') else value
+                              for key, value in face['region'].items()}
+        scaled.append(face)
+    return scaled
+
+def save_image(image, original_path, analysis=None):
+    """
+    Queue the processed image to be saved in the photos_captures directory and return its path.
+    The encode and write happen on the background capture writer; `analysis` goes into the optional sidecar file.
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_name = os.path.basename(original_path)
     name, ext = os.path.splitext(base_name)
-    save_path = os.path.join(captures_dir, f"{name}_{timestamp}{ext}")
-    cv2.imwrite(save_path, image)
-    print(f"Saved processed image to {save_path}")
+    metadata = {"source": original_path, "faces": analysis} if analysis is not None else None
+    save_path = get_capture_writer().submit(image, os.path.join(captures_dir, f"{name}_{timestamp}{ext}"), metadata)
+    print(f"Saving processed image to {save_path}")
+    return save_path
 
 def analyze_image(image_path):
     """Analyze a single image for emotions."""
     try:
-        analysis = DeepFace.analyze(img_path=image_path, actions=['emotion'], enforce_detection=False)
+        with metrics.span("analyze"):
+            analysis = result_cache.cached_analyze(image_path)
 
-        image = cv2.imread(image_path)
+        with metrics.span("decode"):
+            image = cv2.imread(image_path)
         if image is None:
             raise ValueError("Error loading image.")
 
-        draw_face_box_and_emotions(image, analysis)
-        resized_image = resize_image_for_display(image)
+        with metrics.span("overlay_draw"):
+            draw_face_box_and_emotions(image, analysis)
+        with metrics.span("resize"):
+            resized_image = resize_image_for_display(image)
 
-        # Save the processed image
-        save_image(image, image_path)
+        # Save the processed image in the background while it is shown
+        save_path = save_image(image, image_path, analysis)
+        results_store.get_store().record(analysis, "photo", source=image_path, capture_path=save_path)
 
         # Display the processed image
         cv2.imshow("Emotion Analysis", resized_image)
@@ -137,7 +205,7 @@ def analyze_image(image_path):
 
 def analyze_folder_with_navigation(folder_path):
     """Analyze all images in a given folder with navigation support and visible buttons below the image."""
-    images = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    images = list_images(folder_path)
     if not images:
         messagebox.showerror("No Images Found", "The selected folder does not contain any supported image files.")
         create_selection_screen()
@@ -145,26 +213,47 @@ def analyze_folder_with_navigation(folder_path):
 
     index = 0
 
-    def show_image(canvas):
-        nonlocal index
-        image_path = images[index]
-        try:
-            analysis = DeepFace.analyze(img_path=image_path, actions=['emotion'], enforce_detection=False)
+    def render_image(position):
+        """Analyze and render one image for display; runs on a prefetch thread."""
+        image_path = images[position]
+        with metrics.span("analyze"):
+            analysis = result_cache.cached_analyze(image_path)
 
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError("Error loading image.")
-            draw_face_box_and_emotions(image, analysis)
+        with metrics.span("decode"):
+            image, factor = read_for_display(image_path)
+        if image is None:
+            raise ValueError("Error loading image.")
+        with metrics.span("overlay_draw"):
+            draw_face_box_and_emotions(image, scale_analysis(analysis, factor) if factor != 1 else analysis)
+        with metrics.span("resize"):
             resized_image = resize_image_for_display(image)
+        return cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
 
-            bgr_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(bgr_image)
-            photo = ImageTk.PhotoImage(pil_image)
+    # Buffered renderings get a quarter of the memory budget
+    prefetcher = Prefetcher(render_image, len(images), max_bytes=MEMORY_LIMIT_MB * 1024 * 1024 // 4)
 
-            canvas.image = photo
-            canvas.create_image(0, 0, anchor="nw", image=photo)
-        except Exception as e:
-            print(f"Error processing image {image_path}: {e}")
+    def show_image(canvas):
+        """Display the current image as soon as its prefetched rendering is ready."""
+        shown_index = index
+        future = prefetcher.request(shown_index)
+
+        def display():
+            if shown_index != index or not canvas.winfo_exists():
+                return  # The user has moved on; a newer request will display itself
+            if not future.done():
+                canvas.after(20, display)
+                return
+            try:
+                with metrics.span("photoimage"):
+                    pil_image = Image.fromarray(future.result())
+                    photo = ImageTk.PhotoImage(pil_image)
+
+                canvas.image = photo
+                canvas.create_image(0, 0, anchor="nw", image=photo)
+            except Exception as e:
+                print(f"Error processing image {images[shown_index]}: {e}")
+
+        display()
 
     def next_image(canvas):
         nonlocal index
@@ -183,6 +272,7 @@ def analyze_folder_with_navigation(folder_path):
             messagebox.showinfo("Start of Folder", "You are at the first image.")
 
     def close_navigation():
+        prefetcher.close()
         navigation_window.destroy()
         create_selection_screen()
 
@@ -207,6 +297,7 @@ def analyze_folder_with_navigation(folder_path):
            command=close_navigation).pack(side="left", padx=10)
 
     navigation_window.mainloop()
+    prefetcher.close()
 
 def create_selection_screen():
     """Create an appealing UI for selecting a folder or single image."""
@@ -234,8 +325,182 @@ def create_selection_screen():
 
     root.mainloop()
 
+def iter_images(folder_path):
+    """Yield the paths of the supported images in a folder as they are found, without listing it all first."""
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                yield entry.path
+
+def list_images(folder_path):
+    """Return the sorted paths of all supported images in a folder."""
+    return sorted(iter_images(folder_path))
+
+def init_batch_worker(detector):
+    """Load the emotion model once per worker process by running a warm-up analysis."""
+    cv2.setNumThreads(1)
+    # The parent resolved the batch detector once, so auto mode does not calibrate in every worker
+    detector_selection.pin(detector_selection.BATCH, detector)
+    inference_server.warm_up((detector_selection.BATCH,))
+
+def analyze_batch_image(image_path):
+    """Analyze one image inside a batch worker and return its JSONL record."""
+    try:
+        analysis = result_cache.cached_analyze(image_path, inference_server.analyze_local)
+
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError("Error loading image.")
+
+        draw_face_box_and_emotions(image, analysis)
+        output_path = save_image(image, image_path, analysis)
+        # Pool workers can exit without warning, so make sure the file is on disk before reporting it
+        get_capture_writer().flush()
+        return {"path": image_path, "faces": analysis, "output": output_path}
+    except Exception as e:
+        return {"path": image_path, "error": str(e)}
+
+def imap_bounded(pool, function, items, max_in_flight):
+    """
+    Like pool.imap_unordered, but takes items from the iterable only as results come back, so at most
+    max_in_flight items are queued or being worked on at any time (imap_unordered reads the whole iterable up front).
+    """
+    results = queue.Queue()
+    in_flight = 0
+    for item in items:
+        pool.apply_async(function, (item,), callback=results.put,
+                         error_callback=lambda e, item=item: results.put({"path": item, "error": str(e)}))
+        in_flight += 1
+        if in_flight >= max_in_flight:
+            yield results.get()
+            in_flight -= 1
+    while in_flight:
+        yield results.get()
+        in_flight -= 1
+
+def batch_workers(requested=None, memory_limit_mb=MEMORY_LIMIT_MB):
+    """Worker processes for a batch run: the requested number (CPU count by default), capped to fit the memory ceiling."""
+    workers = max(1, requested or os.cpu_count() or 1)
+    fit = max(1, memory_limit_mb // WORKER_MEMORY_MB)
+    if workers > fit:
+        print(f"Using {fit} of {workers} workers to stay within {memory_limit_mb} MB "
+              f"({WORKER_MEMORY_MB} MB per worker, see EMOTION_WORKER_MEMORY_MB)")
+    return min(workers, fit)
+
+def run_batch(folder_path, workers=None, output_path=None, incremental=False, watch=False, poll_interval=2.0,
+              memory_limit_mb=MEMORY_LIMIT_MB):
+    """
+    Analyze every image in a folder without a UI, spreading the work over a process pool.
+    Args:
+        folder_path: The folder containing the images to analyze.
+        workers: The number of worker processes (defaults to the CPU count); capped so that workers of
+            WORKER_MEMORY_MB each fit in memory_limit_mb.
+        output_path: The JSONL file receiving one result per image.
+        incremental: Skip images the manifest has already seen unchanged; an interrupted run resumes where it stopped.
+        watch: Keep running and analyze new or changed images as they land in the folder (implies incremental).
+        poll_interval: Seconds between rescans in watch mode.
+        memory_limit_mb: Memory ceiling for the whole run.
+    """
+    manifest = Manifest() if incremental or watch else None
+    if manifest is not None:
+        images = list_images(folder_path)
+        total = len(images)
+        images = manifest.pending(folder_path, images, settle_seconds=0)
+        print(f"{total - len(images)} of {total} images already analyzed")
+        if not images and not watch:
+            print(f"No new supported images found in {folder_path}")
+            return 0
+    else:
+        # Stream the folder instead of listing it, so memory does not grow with the number of files
+        images = iter_images(folder_path)
+        first = next(images, None)
+        if first is None:
+            print(f"No supported images found in {folder_path}")
+            return 0
+        images = itertools.chain([first], images)
+
+    workers = batch_workers(workers, memory_limit_mb)
+    if isinstance(images, list) and not watch:
+        workers = min(workers, len(images))
+    output_path = output_path or os.path.join(captures_dir, "batch_results.jsonl")
+
+    # One TensorFlow thread pool per process; the parallelism comes from the workers
+    for variable in ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS", "OMP_NUM_THREADS"):
+        os.environ.setdefault(variable, "1")
+
+    # Only this process writes to the results store and the manifest, so the workers never contend for them
+    store = results_store.get_store()
+    detector = inference_server.detector_name(detector_selection.BATCH)
+
+    def analyze_all(pool, output_file, images):
+        total = f"/{len(images)}" if isinstance(images, list) else ""
+        print(f"Analyzing {len(images) if total else 'all'} images with {workers} workers...")
+        failures = 0
+        done = 0
+        # Two images per worker keep every worker busy without reading ahead through the folder; in-flight
+        # items are only paths, the decoded images live in the workers, one at a time each
+        for done, record in enumerate(imap_bounded(pool, analyze_batch_image, images, workers * 2), 1):
+            output_file.write(json.dumps(record) + "\n")
+            if "error" in record:
+                failures += 1
+                print(f"Error processing image {record['path']}: {record['error']}")
+            else:
+                store.record(record["faces"], "batch", source=record["path"], capture_path=record["output"], commit=False)
+            if manifest is not None:
+                # Results are committed before the file is marked, so a resumed run never loses one
+                output_file.flush()
+                store.commit()
+                manifest.mark(record["path"], "failed" if "error" in record else "done", record.get("output"))
+            if done % 100 == 0:
+                output_file.flush()
+                store.commit()
+                print(f"Processed {done}{total} images")
+        output_file.flush()
+        store.commit()
+        print(f"Processed {done}{total} images")
+        return failures
+
+    failures = 0
+    # Spawn instead of fork: TensorFlow does not survive being forked
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=init_batch_worker, initargs=(detector,)) as pool, \
+            open(output_path, "a", encoding="utf-8") as output_file:
+        if images:
+            failures += analyze_all(pool, output_file, images)
+        if watch:
+            try:
+                for new_images in watch_folder(folder_path, manifest, list_images, poll_interval):
+                    failures += analyze_all(pool, output_file, new_images)
+            except KeyboardInterrupt:
+                print("Stopped watching.")
+
+    if manifest is not None:
+        manifest.close()
+    print(f"Batch results written to {output_path} ({failures} failed)")
+    return failures
+
 def main():
-    create_selection_screen()
+    parser = argparse.ArgumentParser(description="Emotion analysis for photos.")
+    parser.add_argument("--batch", metavar="DIR", help="analyze every image in DIR without opening the UI")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes for --batch (default: CPU count); "
+                             "capped to EMOTION_MEMORY_LIMIT_MB / EMOTION_WORKER_MEMORY_MB")
+    parser.add_argument("--output", default=None, help="JSONL results file for --batch (default: photos_captures/batch_results.jsonl)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --batch, only analyze new or changed images; resumes an interrupted run")
+    parser.add_argument("--watch", action="store_true", help="with --batch, keep analyzing images as they land in DIR")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between folder rescans for --watch")
+    args = parser.parse_args()
+
+    metrics.enable_from_environment()
+    if args.batch:
+        run_batch(args.batch, workers=args.workers, output_path=args.output, incremental=args.incremental,
+                  watch=args.watch, poll_interval=args.poll_interval)
+    else:
+        create_selection_screen()
+    # Captures are written in the background; wait for the last ones before exiting
+    if capture_writer is not None:
+        capture_writer.flush()
+    metrics.flush()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BUFFER_BYTES = 256 * 1024 * 1024
+
+class Prefetcher:
+    """
+    Read-ahead buffer for the folder navigator.
+    Args:
+        load: Callable turning an index into a rendered image (numpy array) in a background thread.
+        count: The number of items that can be navigated.
+        ahead: How many items to prepare in the direction of travel.
+        behind: How many items to keep ready in the opposite direction.
+        max_bytes: Upper bound for the memory held by finished, buffered images.
+        workers: The number of background threads.
+    """
+
+    def __init__(self, load, count, ahead=3, behind=1, max_bytes=MAX_BUFFER_BYTES, workers=1):
+        self.load = load
+        self.count = count
+        self.ahead = ahead
+        self.behind = behind
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.lock = threading.RLock()
+        self.futures = {}
+        self.current = 0
+        self.direction = 1
+        self.item_bytes = 0  # Size of the last finished image, used to size the window
+
+    def wanted(self):
+        """Indexes to keep buffered, current first, then in order of likely use."""
+        indexes = [self.current]
+        indexes += [self.current + self.direction * step for step in range(1, self.ahead + 1)]
+        indexes += [self.current - self.direction * step for step in range(1, self.behind + 1)]
+        return [index for index in indexes if 0 <= index < self.count]
+
+    def request(self, index):
+        """Make `index` the current item, reschedule read-ahead and return the future for `index`."""
+        with self.lock:
+            if index != self.current:
+                self.direction = 1 if index > self.current else -1
+            self.current = index
+            wanted = self.wanted()
+            if self.item_bytes:
+                wanted = wanted[:max(1, self.max_bytes // self.item_bytes)]
+
+            # Cancel work that is no longer in the window (e.g. after a change of direction)
+            for stale in [key for key in self.futures if key not in wanted]:
+                self.futures.pop(stale).cancel()
+
+            for key in wanted:
+                if key not in self.futures:
+                    future = self.executor.submit(self.load, key)
+                    self.futures[key] = future
+                    future.add_done_callback(self.on_done)
+            self.trim()
+            return self.futures[index]
+
+    def on_done(self, future):
+        with self.lock:
+            if not future.cancelled() and future.exception() is None:
+                self.item_bytes = getattr(future.result(), "nbytes", 0)
+            self.trim()
+
+    def trim(self):
+        """Drop finished images farthest from the current one until the buffer fits in max_bytes."""
+        finished = [(key, future) for key, future in self.futures.items()
+                    if future.done() and not future.cancelled() and future.exception() is None]
+        total = sum(getattr(future.result(), "nbytes", 0) for _, future in finished)
+        for key, future in sorted(finished, key=lambda item: abs(item[0] - self.current), reverse=True):
+            if total <= self.max_bytes or key == self.current:
+                break
+            total -= getattr(future.result(), "nbytes", 0)
+            del self.futures[key]
+
+    def close(self):
+        with self.lock:
+            for future in self.futures.values():
+                future.cancel()
+            self.futures.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+import face_pipeline
+import emotion_backends
+import inference_server
+
+CACHE_PATH = os.path.join("cache", "analysis_cache.sqlite")
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Bump when the stored analysis format changes
+CACHE_FORMAT_VERSION = 2
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def content_hash(image_path, chunk_size=1024 * 1024):
+    """Return the BLAKE2b digest of a file's bytes."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(image_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Persistent store of analysis results keyed by image content and analysis settings.
+    Entries are evicted least-recently-used first once the stored results exceed max_bytes.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._settings = None
+        self.settings_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by the UI and prefetch threads; access is serialized by self.lock
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self.connection.commit()
+
+    @property
+    def settings(self):
+        """
+        Analysis settings that are part of every key, resolved on first use. The detector name comes from
+        the inference server in auto mode, so opening the cache never runs a detector calibration.
+        """
+        with self.settings_lock:
+            if self._settings is None:
+                self._settings = "|".join([face_pipeline.MODEL_NAME, inference_server.detector_name(inference_server.BATCH),
+                                           ",".join(str(size) for size in face_pipeline.DETECTION_SIZES),
+                                           emotion_backends.backend_name(), face_pipeline.deepface_version(),
+                                           str(CACHE_FORMAT_VERSION)])
+            return self._settings
+
+    def key_for(self, image_path):
+        return f"{content_hash(image_path)}|{self.settings}"
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key, faces):
+        value = json.dumps(faces)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                                    (key, value, len(value), time.time()))
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its size limit."""
+        total, = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        expired = []
+        for key, size in self.connection.execute("SELECT key, size FROM results ORDER BY last_access"):
+            if total <= target:
+                break
+            expired.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM results WHERE key = ?", expired)
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+    return _cache
+
+def cached_analyze(image_path, analyze=inference_server.analyze):
+    """Return the analysis for an image file, running `analyze` only when the content has not been seen before."""
+    cache = get_cache()
+    key = cache.key_for(image_path)
+    faces = cache.get(key)
+    if faces is None:
+        faces = analyze(image_path)
+        cache.put(key, faces)
+    return faces
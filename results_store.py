@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+STORE_PATH = os.path.join("cache", "results.sqlite")
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+NEGATIVE_EMOTIONS = ["angry", "disgust", "fear", "sad"]
+KINDS = ("live", "photo", "batch")
+
+_store = None
+_store_lock = threading.Lock()
+
+def stress_grade(emotions):
+    """Sum of the negative emotion percentages, clamped to 0-100 like the photo and live overlays."""
+    return min(max(sum(emotions.get(emotion, 0) for emotion in NEGATIVE_EMOTIONS), 0), 100)
+
+class ResultStore:
+    """
+    Structured, indexed record of every saved analysis: one row per capture and one per detected face.
+    The face rows repeat the capture time, so the common filters (time range, stress grade, emotion)
+    are answered from a single indexed table without a join, even with millions of rows.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL this keeps commits cheap; the last transactions may be lost on power failure, never corrupted
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        emotion_columns = ", ".join(f"{emotion} REAL NOT NULL" for emotion in EMOTIONS)
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                kind TEXT NOT NULL,
+                source TEXT,
+                capture_path TEXT,
+                face_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS faces (
+                id INTEGER PRIMARY KEY,
+                capture_id INTEGER NOT NULL REFERENCES captures (id) ON DELETE CASCADE,
+                created REAL NOT NULL,
+                x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+                confidence REAL,
+                {emotion_columns},
+                dominant_emotion TEXT NOT NULL,
+                stress_grade REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS captures_created ON captures (created);
+            CREATE INDEX IF NOT EXISTS captures_source ON captures (source);
+            CREATE INDEX IF NOT EXISTS faces_created ON faces (created);
+            CREATE INDEX IF NOT EXISTS faces_stress_created ON faces (stress_grade, created);
+            CREATE INDEX IF NOT EXISTS faces_emotion_created ON faces (dominant_emotion, created);
+            CREATE INDEX IF NOT EXISTS faces_capture ON faces (capture_id);
+        """)
+        self.connection.commit()
+
+    def record(self, faces, kind, source=None, capture_path=None, created=None, commit=True):
+        """
+        Store one analysis. Faces are dicts in DeepFace's analysis format; whole-image fallbacks
+        (face_confidence 0) are not stored as faces. Pass commit=False to group many records into one transaction.
+        Returns the capture id.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown capture kind: {kind}")
+        created = time.time() if created is None else created
+        faces = [face for face in faces or [] if face.get("face_confidence", 1) > 0]
+        rows = []
+        for face in faces:
+            emotions = face.get("emotion", {})
+            region = face.get("region", {})
+            rows.append([created, region.get("x"), region.get("y"), region.get("w"), region.get("h"),
+                         face.get("face_confidence")]
+                        + [float(emotions.get(emotion, 0)) for emotion in EMOTIONS]
+                        + [face.get("dominant_emotion") or max(emotions, key=emotions.get, default="unknown"),
+                           float(stress_grade(emotions))])
+        placeholders = ", ".join("?" for _ in range(len(EMOTIONS) + 9))
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO captures (created, kind, source, capture_path, face_count) VALUES (?, ?, ?, ?, ?)",
+                (created, kind, source, capture_path, len(faces)))
+            capture_id = cursor.lastrowid
+            self.connection.executemany(
+                f"INSERT INTO faces (capture_id, created, x, y, w, h, confidence, {', '.join(EMOTIONS)}, "
+                f"dominant_emotion, stress_grade) VALUES ({placeholders})",
+                [[capture_id] + row for row in rows])
+            if commit:
+                self.connection.commit()
+        return capture_id
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+
+    @staticmethod
+    def filters(min_stress=None, max_stress=None, since=None, until=None, emotion=None, kind=None, source=None):
+        """WHERE clause and parameters over the faces table (aliased f) joined to captures (aliased c)."""
+        clauses, parameters = [], []
+        for clause, value in (("f.stress_grade > ?", min_stress), ("f.stress_grade <= ?", max_stress),
+                              ("f.created >= ?", since), ("f.created < ?", until),
+                              ("f.dominant_emotion = ?", emotion), ("c.kind = ?", kind), ("c.source = ?", source)):
+            if value is not None:
+                clauses.append(clause)
+                parameters.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    def query(self, limit=100, offset=0, newest_first=True, **filters):
+        """
+        Return matching faces with their capture's details, newest first by default.
+        Filters: min_stress (exclusive), max_stress (inclusive), since, until (Unix timestamps), emotion (dominant),
+        kind, source.
+        """
+        where, parameters = self.filters(**filters)
+        order = "DESC" if newest_first else "ASC"
+        sql = (f"SELECT f.*, c.kind, c.source, c.capture_path FROM faces f JOIN captures c ON c.id = f.capture_id"
+               f"{where} ORDER BY f.created {order} LIMIT ? OFFSET ?")
+        with self.lock:
+            rows = self.connection.execute(sql, parameters + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, **filters):
+        where, parameters = self.filters(**filters)
+        join = " JOIN captures c ON c.id = f.capture_id" if filters.get("kind") or filters.get("source") else ""
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM faces f{join}{where}", parameters).fetchone()[0]
+
+    def summary(self, **filters):
+        """Face count, average stress grade and dominant emotion counts for the matching faces."""
+        where, parameters = self.filters(**filters)
+        join = " JOIN captures c ON c.id = f.capture_id" if filters.get("kind") or filters.get("source") else ""
+        with self.lock:
+            total, average = self.connection.execute(
+                f"SELECT COUNT(*), AVG(f.stress_grade) FROM faces f{join}{where}", parameters).fetchone()
+            emotions = self.connection.execute(
+                f"SELECT f.dominant_emotion, COUNT(*) FROM faces f{join}{where} GROUP BY f.dominant_emotion",
+                parameters).fetchall()
+        # Sorting the handful of groups here keeps a temporary B-tree out of the query plan
+        emotions = sorted(emotions, key=lambda row: row[1], reverse=True)
+        return {"faces": total, "average_stress_grade": average, "dominant_emotions": {row[0]: row[1] for row in emotions}}
+
+    def close(self):
+        with self.lock:
+            # Refresh the planner statistics the indexes are chosen by
+            self.connection.execute("PRAGMA optimize")
+            self.connection.close()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore()
+    return _store
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the stored emotion analyses.")
+    parser.add_argument("--min-stress", type=float, help="only faces with a stress grade above this")
+    parser.add_argument("--max-stress", type=float, help="only faces with at most this stress grade")
+    parser.add_argument("--days", type=float, help="only the last N days")
+    parser.add_argument("--emotion", choices=EMOTIONS, help="only faces with this dominant emotion")
+    parser.add_argument("--kind", choices=KINDS, help="only live captures, single photos or batch results")
+    parser.add_argument("--source", help="only results for this source path")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--count", action="store_true", help="print the number of matching faces only")
+    parser.add_argument("--summary", action="store_true", help="print counts and the average stress grade")
+    parser.add_argument("--json", action="store_true", help="print one JSON record per line")
+    parser.add_argument("--store", default=STORE_PATH)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    filters = {"min_stress": args.min_stress, "max_stress": args.max_stress, "emotion": args.emotion,
+               "kind": args.kind, "source": args.source,
+               "since": time.time() - args.days * 86400 if args.days is not None else None}
+    try:
+        if args.count:
+            print(store.count(**filters))
+        elif args.summary:
+            print(json.dumps(store.summary(**filters), indent=2))
+        else:
+            for row in store.query(limit=args.limit, **filters):
+                if args.json:
+                    print(json.dumps(row))
+                else:
+                    when = datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M:%S")
+                    print(f"{when}  {row['kind']:<5}  stress {row['stress_grade']:5.1f}%  "
+                          f"{row['dominant_emotion']:<8}  {row['capture_path'] or row['source'] or ''}")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
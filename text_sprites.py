@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+MAX_SPRITES = 2048
+
+# A sprite is a tuple of (dx, dy, pixels) pieces, offsets relative to the text position the caller passes in
+
+def render_label(text, font_scale, color, bg_color, thickness=1):
+    """Pre-render a label on an opaque background box, laid out like emotion_detector.draw_text_with_background."""
+    text_width, text_height = cv2.getTextSize(text, FONT, font_scale, thickness)[0]
+    # The box spans (x, y - h - 5) to (x + w + 10, y + 5), both corners included
+    pixels = np.empty((text_height + 11, text_width + 11, 3), dtype=np.uint8)
+    pixels[:] = bg_color
+    baseline_y = text_height + 5
+    cv2.putText(pixels, text, (5, baseline_y), FONT, font_scale, color, thickness, cv2.LINE_AA)
+    return ((0, -baseline_y, pixels),)
+
+def draw_label(image, text, position, font_scale, color, bg_color=(0, 0, 0), thickness=1):
+    """Draw a label straight onto the image with the same layout as render_label, for text that changes every frame."""
+    x, y = position
+    text_width, text_height = cv2.getTextSize(text, FONT, font_scale, thickness)[0]
+    cv2.rectangle(image, (x, y - text_height - 5), (x + text_width + 10, y + 5), bg_color, cv2.FILLED)
+    cv2.putText(image, text, (x + 5, y), FONT, font_scale, color, thickness, cv2.LINE_AA)
+
+def wrap_text(text, font_scale, max_width, thickness=1):
+    """Split text into lines no wider than max_width pixels."""
+    lines = []
+    current_line = ''
+    for word in text.split(' '):
+        test_line = f"{current_line} {word}".strip()
+        if cv2.getTextSize(test_line, FONT, font_scale, thickness)[0][0] > max_width:
+            lines.append(current_line)
+            current_line = word
+        else:
+            current_line = test_line
+    lines.append(current_line)
+    return lines
+
+def render_wrapped(text, font_scale, color, max_width, bg_color=(0, 0, 0)):
+    """Pre-render a wrapped text block, one background box per line."""
+    pieces = []
+    y = 0
+    for line in wrap_text(text, font_scale, max_width):
+        (dx, dy, pixels), = render_label(line, font_scale, color, bg_color)
+        pieces.append((dx, y + dy, pixels))
+        y += cv2.getTextSize(line, FONT, font_scale, 1)[0][1] + 10
+    return tuple(pieces)
+
+def blit(image, sprite, position):
+    """Copy a sprite onto the image at a text position, clipped to the image bounds."""
+    height, width = image.shape[:2]
+    x, y = position
+    for dx, dy, pixels in sprite:
+        left, top = x + dx, y + dy
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + pixels.shape[1], width), min(top + pixels.shape[0], height)
+        if x0 < x1 and y0 < y1:
+            image[y0:y1, x0:x1] = pixels[y0 - top:y1 - top, x0 - left:x1 - left]
+
+class SpriteCache:
+    """Bounded LRU cache of pre-rendered text sprites keyed by text, scale and colours."""
+
+    def __init__(self, max_sprites=MAX_SPRITES):
+        self.max_sprites = max_sprites
+        self.sprites = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        with self.lock:
+            sprite = self.sprites.get(key)
+            if sprite is not None:
+                self.sprites.move_to_end(key)
+                self.hits += 1
+                return sprite
+            self.misses += 1
+        sprite = render()
+        with self.lock:
+            self.sprites[key] = sprite
+            while len(self.sprites) > self.max_sprites:
+                self.sprites.popitem(last=False)
+        return sprite
+
+    def label(self, text, font_scale, color, bg_color=(0, 0, 0), thickness=1):
+        return self.get(("label", text, font_scale, color, bg_color, thickness),
+                        lambda: render_label(text, font_scale, color, bg_color, thickness))
+
+    def wrapped(self, text, font_scale, color, max_width):
+        return self.get(("wrapped", text, font_scale, color, max_width),
+                        lambda: render_wrapped(text, font_scale, color, max_width))
+
+    def prefill_quotes(self, quotes, font_scale, color, max_width):
+        """Render every quote ahead of time so the live overlay never has to wrap text."""
+        for lines in quotes.values():
+            for quote in lines:
+                self.wrapped(quote, font_scale, color, max_width)
@@ -0,0 +1,94 @@
+import time
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+# Space kept free around the image inside the label so the label never asks to grow
+LABEL_MARGIN = 4
+
+class FrameDisplay:
+    """
+    Shows BGR frames in a Tk label, scaled once to the label's current size.
+    The scaled and colour-converted buffers and the PhotoImage are allocated once per display size and
+    reused: each frame is resized and converted into them with OpenCV and pasted into the existing
+    PhotoImage, instead of building a full-resolution PIL image and a new PhotoImage for every frame.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.size = None
+        self.resized = None
+        self.rgb = None
+        self.photo = None
+
+    def target_size(self, frame):
+        """The frame size scaled to fit the label, keeping the aspect ratio."""
+        frame_height, frame_width = frame.shape[:2]
+        width = self.label.winfo_width() - LABEL_MARGIN
+        height = self.label.winfo_height() - LABEL_MARGIN
+        if width <= 1 or height <= 1:
+            return frame_width, frame_height  # Not laid out yet
+        scale = min(width / frame_width, height / frame_height)
+        return max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+
+    def show(self, frame):
+        size = self.target_size(frame)
+        if size != self.size:
+            width, height = size
+            self.size = size
+            self.resized = np.empty((height, width, 3), dtype=np.uint8)
+            self.rgb = np.empty((height, width, 3), dtype=np.uint8)
+            self.photo = ImageTk.PhotoImage("RGB", size)
+            self.label.configure(image=self.photo)
+            self.label.imgtk = self.photo
+
+        if size == (frame.shape[1], frame.shape[0]):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        else:
+            cv2.resize(frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        # frombuffer wraps the array without copying; paste() copies it into Tk's own image
+        self.photo.paste(Image.frombuffer("RGB", size, self.rgb, "raw", "RGB", 0, 1))
+
+def next_frame_delay(frame_timestamp, frame_rate, fallback_ms=15):
+    """Milliseconds until the frame after the one captured at `frame_timestamp` is due, from the measured capture rate."""
+    if frame_rate <= 0:
+        return fallback_ms
+    due = frame_timestamp + 1 / frame_rate
+    return max(1, int((due - time.perf_counter()) * 1000) + 1)
+
+# --- Benchmark against the previous per-frame PhotoImage path ---
+
+def show_legacy(label, frame):
+    """The previous update_frame conversion: full-resolution RGB copy, PIL image and a new PhotoImage per frame."""
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    frame_pil = Image.fromarray(frame_rgb)
+    frame_tk = ImageTk.PhotoImage(image=frame_pil)
+    label.imgtk = frame_tk
+    label.configure(image=frame_tk)
+
+def benchmark(frame_size=(1280, 720), label_size=(860, 560), frames=300):
+    """Wall and CPU time per displayed frame for the previous and the current display path."""
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.geometry(f"{label_size[0] + 40}x{label_size[1] + 40}")
+    label = tk.Label(root)
+    label.pack(fill="both", expand=True)
+    root.update()
+    random = np.random.default_rng(0)
+    width, height = frame_size
+    source = [random.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(8)]
+
+    display = FrameDisplay(label)
+    report = {"frame_size": list(frame_size), "label_size": [label.winfo_width(), label.winfo_height()], "frames": frames}
+    for name, show in (("legacy", lambda frame: show_legacy(label, frame)), ("current", display.show)):
+        wall, cpu = time.perf_counter(), time.process_time()
+        for index in range(frames):
+            show(source[index % len(source)])
+            root.update_idletasks()
+        report[name] = {"frame_ms": 1000 * (time.perf_counter() - wall) / frames,
+                        "cpu_ms_per_frame": 1000 * (time.process_time() - cpu) / frames}
+    report["speedup"] = report["legacy"]["frame_ms"] / report["current"]["frame_ms"]
+    root.destroy()
+    return report
@@ -1,16 +1,15 @@
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk, ImageDraw
-import threading
 import subprocess
-import time
 import os
 import signal
-import cv2 
+import socket
 import logging
+from events import EventListener, MODEL_LOADED, FIRST_FRAME, ERROR, EXIT
 
-SIGNAL_FILE = "camera_ready.signal"
 processes = []  # Keep track of subprocesses
+live_process = None  # The running live emotion window, if any
 child_windows = []  # Keep track of child windows
 
 def show_custom_messagebox(title, message, buttons):
@@ -87,65 +86,59 @@ def show_permission_dialog():
         [("Yes", agree), ("No", disagree)]
     )
 
-import cv2  # Import OpenCV library
-
 def start_camera():
-    """Start camera and check readiness."""
-    camera_index = 0
-    cap = cv2.VideoCapture(camera_index)
-
-    if not cap.isOpened():
-        show_custom_messagebox(
-            "Camera In Use",
-            "The camera is being used by another application. Close other applications and try again.",
-            [("OK", lambda: None)]
-        )
-        return
-
-    ret, _ = cap.read()
-    cap.release()
-
-    if not ret:
-        show_custom_messagebox(
-            "Camera In Use",
-            "The camera isn't available. It may be in use by another application.",
-            [("OK", lambda: None)]
-        )
-        return
-
-    if os.path.exists(SIGNAL_FILE):
+    """Start the live emotion window and follow its readiness events."""
+    global live_process
+    if live_process is not None and live_process.poll() is None:
         show_custom_messagebox("Camera Ready", "The camera is already ready to use.", [("OK", lambda: None)])
         return
 
-    show_custom_messagebox("Camera Starting", "The camera will start shortly. Please wait.", [("OK", lambda: None)])
-    process = subprocess.Popen(["python", "emotion_detector.py"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    listener = EventListener()
+    process = subprocess.Popen(["python", "emotion_detector.py", "--events-port", str(listener.port)])
     processes.append(process)
+    live_process = process
+    root.after(50, monitor_camera_events, process, listener)
 
-    threading.Thread(target=monitor_camera_ready, args=(process,), daemon=True).start()
+    show_custom_messagebox("Camera Starting", "The camera will start shortly. Please wait.", [("OK", lambda: None)])
 
-def monitor_camera_ready(process):
-    """Monitor the camera readiness signal."""
-    while not os.path.exists(SIGNAL_FILE):
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
+def monitor_camera_events(process, listener, heard=False):
+    """
+    React on the Tk thread to the events the live window reports over the readiness channel.
+    `heard` tells whether the window has reported anything yet, so a crash during startup is not silent.
+    """
+    messages = []
+    finished = False
+    for event in listener.poll():
+        kind = event.get("event")
+        heard = heard or kind != EXIT
+        if kind == FIRST_FRAME:
+            messages.append(("Camera Ready", "The camera is ready. You can now start live emotion analysis."))
+        elif kind == MODEL_LOADED:
+            logging.info("Emotion model loaded in the live window.")
+        elif kind == ERROR and event.get("source") == "camera":
             if process.poll() is None:
                 process.terminate()
-            show_custom_messagebox(
-                "Camera In Use",
-                "The camera is unavailable. Please close other applications using the camera and try again.",
-                [("OK", lambda: None)]
-            )
-            return
-        cap.release()
-        time.sleep(0.5)
-
-    if os.path.exists(SIGNAL_FILE):
-        if process.poll() is None:
-            show_custom_messagebox(
-                "Camera Ready",
-                "The camera is ready. You can now start live emotion analysis.",
-                [("OK", lambda: None)]
-            )
+            messages.append(("Camera In Use",
+                             "The camera is unavailable. Please close other applications using the camera and try again."))
+            finished = True
+        elif kind == ERROR:
+            messages.append(("Error", event.get("message", "The live emotion window reported an error.")))
+        elif kind == EXIT:
+            finished = True
+
+    # Once connected, the listener reports a lost connection as EXIT; before that only the process can tell
+    if finished or (process.poll() is not None and not listener.connected):
+        listener.close()
+        if not heard:
+            code = process.poll()
+            messages.append(("Error", "The live emotion window closed before it started"
+                                      + (f" (exit code {code})." if code else ".") + " See the terminal for details."))
+    else:
+        root.after(50, monitor_camera_events, process, listener, heard)
+
+    # Message boxes are modal, so show them only after the next poll has been scheduled
+    for title, message in messages:
+        show_custom_messagebox(title, message, [("OK", lambda: None)])
 
 def process_photos():
     """Run the photo emotion analysis script and notify the user."""
@@ -164,6 +157,16 @@ def process_photos():
             [("OK", lambda: None)]
         )
 
+def start_inference_server():
+    """Start the warm inference server shared by the live and photo analysis scripts."""
+    if not hasattr(socket, "AF_UNIX"):
+        return  # Each script falls back to loading its own model
+    try:
+        process = subprocess.Popen(["python", "inference_server.py"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        processes.append(process)
+    except Exception as e:
+        logging.warning(f"Failed to start the inference server: {e}")
+
 def view_captures(folder_name):
     """Open the specified folder containing captures."""
     try:
@@ -310,5 +313,8 @@ photo_captures_button = ttk.Button(
 )
 photo_captures_button.place(relx=0.7, rely=0.7, anchor="center")
 
+# Load the emotion model in the background while the launcher is shown
+start_inference_server()
+
 # Run the Tkinter event loop
 root.mainloop()
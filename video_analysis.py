@@ -0,0 +1,220 @@
+import os
+import csv
+import time
+import argparse
+import cv2
+import inference_server
+import metrics
+from photos import draw_face_box_and_emotions
+from results_store import EMOTIONS, stress_grade
+
+TIMELINE_COLUMNS = ["frame", "time_seconds", "faces", "dominant_emotion", "stress_grade"] + EMOTIONS
+PARQUET_ROW_GROUP = 4096
+captures_dir = "video_captures"
+
+def read_frames(video_path, stride=1, sample_seconds=None):
+    """
+    Yield (frame index, timestamp in seconds, BGR frame) for the sampled frames of a video.
+    Skipped frames are only grabbed, not decoded, so sampling also saves the decode cost.
+    Args:
+        video_path: The video file to read.
+        stride: Keep every `stride`-th frame.
+        sample_seconds: Keep one frame per this many seconds of video instead of using a stride.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if sample_seconds:
+        stride = max(1, round(sample_seconds * fps))
+    try:
+        index = 0
+        while True:
+            if index % stride:
+                if not cap.grab():
+                    return
+                index += 1
+                continue
+            with metrics.span("video_decode"):
+                ret, frame = cap.read()
+            if not ret:
+                return
+            yield index, index / fps, frame
+            index += 1
+    finally:
+        cap.release()
+
+def analyze_frames(frames, analyze=inference_server.analyze):
+    """Yield (frame index, timestamp, frame, detected faces) for every frame; whole-image fallbacks are dropped."""
+    for index, timestamp, frame in frames:
+        with metrics.span("analyze"):
+            faces = analyze(frame)
+        yield index, timestamp, frame, [face for face in faces if face.get("face_confidence", 1) > 0]
+
+def timeline_row(index, timestamp, faces):
+    """One timeline row: the emotions averaged over every face in the frame."""
+    row = {"frame": index, "time_seconds": round(timestamp, 3), "faces": len(faces)}
+    if not faces:
+        row.update({"dominant_emotion": "", "stress_grade": None})
+        row.update({emotion: None for emotion in EMOTIONS})
+        return row
+    averages = {emotion: sum(face["emotion"].get(emotion, 0) for face in faces) / len(faces) for emotion in EMOTIONS}
+    row.update({emotion: round(score, 2) for emotion, score in averages.items()})
+    row["dominant_emotion"] = max(averages, key=averages.get)
+    row["stress_grade"] = round(stress_grade(averages), 2)
+    return row
+
+def aggregate(rows, interval_seconds):
+    """Merge per-frame rows into one row per interval, averaging over the frames that had faces."""
+    bucket = []
+    bucket_index = None
+    for row in rows:
+        index = int(row["time_seconds"] // interval_seconds)
+        if bucket and index != bucket_index:
+            yield merge_rows(bucket, bucket_index * interval_seconds)
+            bucket = []
+        bucket_index = index
+        bucket.append(row)
+    if bucket:
+        yield merge_rows(bucket, bucket_index * interval_seconds)
+
+def merge_rows(rows, start_seconds):
+    with_faces = [row for row in rows if row["faces"]]
+    merged = {"frame": rows[0]["frame"], "time_seconds": round(start_seconds, 3),
+              "faces": max(row["faces"] for row in rows)}
+    if not with_faces:
+        merged.update({"dominant_emotion": "", "stress_grade": None})
+        merged.update({emotion: None for emotion in EMOTIONS})
+        return merged
+    averages = {emotion: sum(row[emotion] for row in with_faces) / len(with_faces) for emotion in EMOTIONS}
+    merged.update({emotion: round(score, 2) for emotion, score in averages.items()})
+    merged["dominant_emotion"] = max(averages, key=averages.get)
+    merged["stress_grade"] = round(sum(row["stress_grade"] for row in with_faces) / len(with_faces), 2)
+    return merged
+
+class CsvTimeline:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=TIMELINE_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+class ParquetTimeline:
+    """Writes the timeline in row groups, so only one group is ever held in memory. Needs pyarrow."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet needs pyarrow (pip install pyarrow); use a .csv timeline instead.")
+        self.pa = pa
+        self.schema = pa.schema([("frame", pa.int64()), ("time_seconds", pa.float64()), ("faces", pa.int32()),
+                                 ("dominant_emotion", pa.string()), ("stress_grade", pa.float64())]
+                                + [(emotion, pa.float64()) for emotion in EMOTIONS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def open_timeline(path):
+    return ParquetTimeline(path) if path.lower().endswith(".parquet") else CsvTimeline(path)
+
+def analyze_video(video_path, timeline_path=None, stride=1, sample_seconds=None, interval_seconds=None,
+                  annotated_path=None, analyze=inference_server.analyze):
+    """
+    Stream a video through detection and emotion analysis and write its emotion timeline.
+    Frames are decoded, analyzed and written one at a time, so memory use does not grow with the video length.
+    Args:
+        video_path: The video file to analyze.
+        timeline_path: CSV or Parquet (by extension) timeline output; defaults to video_captures/<name>_timeline.csv.
+        stride: Analyze every `stride`-th frame.
+        sample_seconds: Analyze one frame per this many seconds instead of using a stride.
+        interval_seconds: Write one averaged row per interval instead of one row per analyzed frame.
+        annotated_path: Optional output video with the face boxes and emotions drawn on the analyzed frames.
+        analyze: The analysis function (defaults to the inference server with in-process fallback).
+    Returns:
+        A summary with the video duration, the wall time and the throughput as a multiple of real time.
+    """
+    os.makedirs(captures_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    timeline_path = timeline_path or os.path.join(captures_dir, f"{name}_timeline.csv")
+
+    probe = cv2.VideoCapture(video_path)
+    fps = probe.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+    probe.release()
+    if sample_seconds:
+        stride = max(1, round(sample_seconds * fps))
+
+    timeline = open_timeline(timeline_path)
+    writer = None
+    analyzed = 0
+    last_time = 0.0
+    start = time.perf_counter()
+    try:
+        def rows():
+            nonlocal writer, analyzed, last_time
+            for index, timestamp, frame, faces in analyze_frames(read_frames(video_path, stride), analyze):
+                analyzed += 1
+                last_time = timestamp
+                if annotated_path:
+                    draw_face_box_and_emotions(frame, faces)
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        writer = cv2.VideoWriter(annotated_path, cv2.VideoWriter_fourcc(*"mp4v"), fps / stride, (width, height))
+                    writer.write(frame)
+                if analyzed % 100 == 0:
+                    print(f"Analyzed {analyzed} frames ({timestamp:.0f}s of video)")
+                yield timeline_row(index, timestamp, faces)
+
+        for row in aggregate(rows(), interval_seconds) if interval_seconds else rows():
+            timeline.write(row)
+    finally:
+        timeline.close()
+        if writer is not None:
+            writer.release()
+
+    elapsed = time.perf_counter() - start
+    video_seconds = total_frames / fps if total_frames > 0 else last_time
+    summary = {"video": video_path, "timeline": timeline_path, "analyzed_frames": analyzed,
+               "video_seconds": round(video_seconds, 2), "wall_seconds": round(elapsed, 2),
+               "realtime_factor": round(video_seconds / elapsed, 2) if elapsed else 0.0}
+    print(f"Analyzed {video_seconds:.1f}s of video in {elapsed:.1f}s ({summary['realtime_factor']:.2f}x real time); "
+          f"timeline written to {timeline_path}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Emotion timeline for a recorded video.")
+    parser.add_argument("video")
+    parser.add_argument("--timeline", help="output .csv or .parquet (default: video_captures/<name>_timeline.csv)")
+    parser.add_argument("--stride", type=int, default=1, help="analyze every N-th frame")
+    parser.add_argument("--sample-seconds", type=float, help="analyze one frame per this many seconds (overrides --stride)")
+    parser.add_argument("--interval", type=float, help="write one averaged row per this many seconds instead of per frame")
+    parser.add_argument("--annotated", metavar="VIDEO", help="also write an annotated .mp4 of the analyzed frames")
+    args = parser.parse_args()
+
+    metrics.enable_from_environment()
+    analyze_video(args.video, timeline_path=args.timeline, stride=max(1, args.stride), sample_seconds=args.sample_seconds,
+                  interval_seconds=args.interval, annotated_path=args.annotated)
+    metrics.flush()
+
+if __name__ == "__main__":
+    main()